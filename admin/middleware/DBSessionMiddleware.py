@@ -1,10 +1,8 @@
-import hashlib
-from datetime import datetime
-
 from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware
 
 from admin.utils.db import async_session_maker
+from admin.utils.sessions import token_digest
 from shared.crud.session import get_session_by_hash, touch_session
 from shared.models import DBSession
 
@@ -13,22 +11,24 @@ class DBSessionMiddleware(BaseHTTPMiddleware):
     COOKIE = "g-session"
 
     async def dispatch(self, request: Request, call_next):
+        # resolved once per request, handlers / dependencies read request.state
+        # (the DB row stays authoritative: logout / deactivation apply to the very next request)
         token = request.cookies.get(self.COOKIE)
         request.state.user = None
         request.state.csrf = None
 
         if token:
-            dhash = hashlib.sha256(token.encode()).hexdigest()
             async with async_session_maker() as db:  # type: AsyncSession
                 sess: DBSession | None = await get_session_by_hash(
                     db,
-                    token_hash=dhash
+                    token_hash=token_digest(token)
                 )
 
                 if sess and sess.is_active and not sess.is_expired():
                     await touch_session(db, sess)
                     request.state.user = sess.user
-                    request.state.csrf = sess.csrf_token
+                    # bytea in db, same 32-char hex as before for forms / X-CSRF
+                    request.state.csrf = sess.csrf_token.hex()
 
         response: Response = await call_next(request)
         return response
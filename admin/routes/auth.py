@@ -1,4 +1,4 @@
-import hashlib
+import asyncio
 import secrets
 import bcrypt
 from datetime import datetime, timedelta, timezone
@@ -17,7 +17,7 @@ from sqlalchemy import update, select
 from admin.templating import templates
 from admin.utils.bot import send_notification
 from admin.utils.config import settings
-from admin.utils.sessions import create_session_tokens
+from admin.utils.sessions import create_session_tokens, token_digest
 from admin.utils.db import get_session
 from admin.utils.urls import sanitize_next
 from shared.crud.user import get_user_by_username
@@ -102,10 +102,15 @@ async def login_post(
     _cleanup_expired()
 
     user = await get_user_by_username(db, username=username)
-    if not user or not user.verify_password(password):
+    # KDF off the event loop
+    if not user or not await asyncio.to_thread(user.verify_password, password):
         templ = "auth/login_form.html" if request.headers.get("HX-Request") else "auth/login_page.html"
         return templates.TemplateResponse(templ, {"request": request, "error": "Неверные данные!", "next": next})
 
+    if user.password_needs_rehash():
+        # lazy upgrade (legacy bcrypt -> argon2id), committed with the rest of the request
+        user.hashed_password = await asyncio.to_thread(User.hash_password, password)
+
     if user.is_2fa_enabled:
         if user.telegram_id is None:
             templ = "auth/login_form.html" if request.headers.get("HX-Request") else "auth/login_page.html"
@@ -117,9 +122,10 @@ async def login_post(
         cid = secrets.token_hex(8)
         ch_exp = datetime.utcnow() + CODE_TTL
 
+        code_hash = await asyncio.to_thread(bcrypt.hashpw, code.encode(), bcrypt.gensalt())
         CHALLENGES[cid] = Challenge(
             uid=user.id,
-            hash=bcrypt.hashpw(code.encode(), bcrypt.gensalt()).decode(),
+            hash=code_hash.decode(),
             exp=ch_exp,
         )
 
@@ -166,7 +172,6 @@ async def login_post(
             user_agent=request.headers.get("user-agent", "")[:256],
         )
         db.add(new_sess)
-        await db.commit()
 
         # response: session-cookie set, challenge-cookie removed
         resp = HTMLResponse("OK")
@@ -198,7 +203,7 @@ async def twofa_post(
         return redirect_login("expired", next=next)
 
     # incorrect code
-    if not bcrypt.checkpw(code.encode(), ch.hash.encode()):
+    if not await asyncio.to_thread(bcrypt.checkpw, code.encode(), ch.hash.encode()):
         ch.tries += 1
         if ch.tries >= MAX_TRIES:
             CHALLENGES.pop(cid, None)
@@ -216,7 +221,6 @@ async def twofa_post(
         user_agent=request.headers.get("user-agent", "")[:256],
     )
     db.add(new_sess)
-    await db.commit()
 
     # cleanup
     CHALLENGES.pop(cid, None)
@@ -242,11 +246,10 @@ async def logout(
 ):
     token = request.cookies.get(SESSION_COOKIE)
     if token:
-        tok_hash = hashlib.sha256(token.encode()).hexdigest()
+        tok_hash = token_digest(token)
         await db.execute(
             update(DBSession).where(DBSession.token_hash == tok_hash).values(is_active=False)
         )
-        await db.commit()
 
     resp = RedirectResponse("/login", status_code=302)
     resp.delete_cookie(SESSION_COOKIE, path="/")
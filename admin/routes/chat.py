@@ -1,13 +1,14 @@
 from __future__ import annotations
 
 import json
+from datetime import datetime
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request, Form, UploadFile, File
 from fastapi.responses import HTMLResponse
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func
+from sqlalchemy import select, desc
 from starlette.responses import Response, RedirectResponse
 
 from admin.templating import templates
@@ -84,14 +85,13 @@ async def chat_page(
         db,
         instance_id=inst.id,
         chat_id=chat_id,
-        offset=0,
         limit=PAGE,
     )
 
     if not messages:
         raise HTTPException(404, "Чат не найден")
 
-    await mark_all_messages_seen(db, instance_id=inst.id, chat_id=chat_id)
+    await mark_all_messages_seen(db, instance_id=inst.id, chat_id=chat_id, commit=False)
 
     return templates.TemplateResponse(
         "chat/chat.html",
@@ -103,8 +103,6 @@ async def chat_page(
             "messages": messages,
             "_cls": _dir_class,
             "MessageDirection": MessageDirection,
-            "offset": PAGE,
-            "page_size": PAGE
         },
     )
 
@@ -115,7 +113,8 @@ async def chat_history(
         api_id: int,
         phone: str,
         request: Request,
-        offset: int = 0,
+        before_ts: datetime,
+        before_id: int,
         session: AsyncSession = Depends(get_session),
         user: User = Depends(require_admin),
 ):
@@ -129,7 +128,7 @@ async def chat_history(
         session,
         instance_id=inst.id,
         chat_id=chat_id,
-        offset=offset,
+        before=(before_ts, before_id),
         limit=PAGE,
     )
 
@@ -140,8 +139,6 @@ async def chat_history(
             "messages": msgs,
             "MessageDirection": MessageDirection,
             "_cls": _dir_class,
-            "offset": offset + PAGE,
-            "page_size": PAGE
         },
     )
 
@@ -203,8 +200,6 @@ async def chat_send(
             is_first=(idx == 0),
         )
 
-    await db.commit()
-
 
 def _clean_phone(num: str) -> str:
     return num.strip().lstrip(" +\t")
@@ -244,12 +239,12 @@ async def new_chat_submit(
 
     chat_id = _mk_chat_id(phone)
 
-    # check if exists
+    # check if exists (first hit of ix_msg_chat_created, no count over the whole chat)
     exists_msg = await db.scalar(
-        select(func.count()).select_from(Message).where(
+        select(Message.id).where(
             Message.instance_id == inst.id,
             Message.chat_id == chat_id,
-        )
+        ).limit(1)
     )
 
     if not exists_msg:
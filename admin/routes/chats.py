@@ -9,7 +9,7 @@ from fastapi.responses import HTMLResponse
 from pydantic import BaseModel
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func, case, distinct
+from sqlalchemy import select, desc, func, case
 from starlette.responses import Response, RedirectResponse
 
 from admin.templating import templates
@@ -17,6 +17,7 @@ from admin.utils.db import get_session, async_session_maker
 from admin.utils.files import _build_media_path, _detect_class, _public_url, notify_send_error, _save_one_message
 from admin.utils.logger import logger
 from admin.utils.security import require_admin, has_instance_access
+from shared.crud.conversations import fetch_dialogs
 from shared.crud.instance import get_instance_by_api_id
 from shared.models import (
     Instance,
@@ -24,7 +25,7 @@ from shared.models import (
     MessageDirection,
     MessageType,
     MessageStatus,
-    User, FileType, MessageFile, Conversation, conversation_tags,
+    User, FileType, MessageFile, Conversation,
 )
 
 router = APIRouter(prefix="/chats")
@@ -88,66 +89,17 @@ async def list_chats_for_instance(
     if not inst or not has_instance_access(user, inst):
         raise HTTPException(status_code=404, detail="Инстанс не найден или нет доступа")
 
-    # 2) allowed_ids = {inst.id} (EXACTLY 1)
-    allowed_ids = {inst.id}
-
-    # 3) CTE
-    last_msg = (
-        select(
-            Message.conversation_id,
-            Message.text,
-            Message.direction,
-            Message.created_at.label("msg_at")
-        )
-        .order_by(Message.conversation_id, Message.created_at.desc())
-        .distinct(Message.conversation_id)
-        .cte("last_msg")
-    )
-
-    c, i, m = Conversation.__table__, Instance.__table__, Message.__table__
-
-    base = (
-        select(
-            c.c.id,
-            i.c.api_id.label("instance_api_id"),
-            c.c.chat_id,
-            c.c.title,
-            c.c.phone,
-            last_msg.c.msg_at.label("last_message_at"),
-            case(
-                (last_msg.c.direction == MessageDirection.out, "Вы: "),
-                (last_msg.c.direction == MessageDirection.sys, "INFO: "),
-                else_=""
-            ).concat(last_msg.c.text).label("last_message"),
-            func.count(distinct(m.c.id)).filter(
-                (m.c.direction == MessageDirection.inc) &
-                (m.c.is_seen.is_(False))
-            ).label("unread"),
-        )
-        .join(i, i.c.id == c.c.instance_id)
-        .join(last_msg, last_msg.c.conversation_id == c.c.id, isouter=True)
-        .join(m, m.c.conversation_id == c.c.id)
-        .where(i.c.id.in_(allowed_ids))
-        .group_by(
-            c.c.id, i.c.api_id,
-            c.c.chat_id, c.c.title, c.c.phone,
-            last_msg.c.msg_at, last_msg.c.text, last_msg.c.direction
-        )
-    )
-
-    if tag_ids:
-        base = base.join(conversation_tags).where(conversation_tags.c.tag_id.in_(tag_ids))
-    if q:
-        like = f"%{q}%"
-        base = base.where((c.c.title.ilike(like)) | (c.c.phone.ilike(like)))
-
-    stmt = (
-        base.order_by(c.c.pinned.desc(), last_msg.c.msg_at.desc().nullslast())
-            .limit(limit).offset(offset)
+    # last message / unread are kept on conversations by DB triggers: one indexed read of
+    # conversations (ix_conv_instance_pinned_last), no per-chat "latest message" lookups
+    rows = await fetch_dialogs(
+        session,
+        instance_id=inst.id,
+        tag_ids=tag_ids or None,
+        q=q,
+        limit=limit,
+        offset=offset,
     )
-
-    rows = (await session.execute(stmt)).mappings().all()
-    return [ChatSummary(**r) for r in rows]
+    return [ChatSummary(instance_api_id=inst.api_id, **r) for r in rows]
 
 
 class InstanceSummary(BaseModel):
@@ -167,27 +119,22 @@ async def list_instances_with_unread(
 ):
     # available instances
     if user.full_access or user.is_owner:
-        allowed_ids: set[int] | None = None
+        allowed_ids: frozenset[int] | None = None
     else:
-        allowed_ids = {inst.id for inst in user.instances}
+        allowed_ids = user.instance_ids
         if not allowed_ids:
             return []
 
-    # 2) agr unread for instance_id
-    m = Message.__table__
+    # 2) agr unread for instance_id (conversation counters, no messages scan)
     c = Conversation.__table__
     i = Instance.__table__
 
     unread_sub = (
         select(
             c.c.instance_id.label("inst_id"),
-            func.count(distinct(m.c.id)).label("unread")
-        )
-        .join(m, m.c.conversation_id == c.c.id)
-        .where(
-            m.c.direction == MessageDirection.inc,
-            m.c.is_seen.is_(False)
+            func.sum(c.c.unread_inc_count).label("unread")
         )
+        .where(c.c.unread_inc_count > 0)
         .group_by(c.c.instance_id)
         .cte("unread")
     )
@@ -2,13 +2,13 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import HTMLResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, distinct
+from sqlalchemy import select, func
 from starlette.requests import Request
 
 from admin.utils.db import get_session
 from admin.utils.security import require_admin, has_instance_access
 from shared.models import (
-    Instance, Conversation, Message, MessageDirection
+    Instance, Conversation
 )
 from shared.crud.conversations import list_conversations, fetch_dialogs
 from admin.templating import templates
@@ -26,21 +26,17 @@ async def sidebar_instances(
     # available
     allowed = (
         None if (user.full_access or user.is_owner)
-        else {inst.id for inst in user.instances}
+        else user.instance_ids
     )
 
-    # per-inst unread
-    m, c = Message.__table__, Conversation.__table__
+    # per-inst unread: sum of trigger-maintained conversation counters, messages aren't scanned
+    c = Conversation.__table__
     unread_per_inst = (
         select(
             c.c.instance_id,
-            func.count(distinct(m.c.id)).label("unread")
-        )
-        .join(m, m.c.conversation_id == c.c.id)
-        .where(
-            m.c.direction == MessageDirection.inc,
-            m.c.is_seen.is_(False)
+            func.sum(c.c.unread_inc_count).label("unread")
         )
+        .where(c.c.unread_inc_count > 0)
         .group_by(c.c.instance_id)
         .cte("u")
     )
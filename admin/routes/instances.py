@@ -18,6 +18,7 @@ from shared.models import Instance, BotMeta, User, InstanceState
 from pydantic import BaseModel, Field, validator
 from fastapi import HTTPException, status, Form
 from shared.crud.instance import create_instance, get_instance_by_api_id
+from shared.crud.user import grant_instance_access
 
 router = APIRouter()
 
@@ -92,7 +93,7 @@ async def create_instance_endpoint(
         # create
         try:
             tg_id = int(form.tg_id)
-            await create_instance(
+            inst = await create_instance(
                 db,
                 api_id=form.api_id,
                 api_url=form.api_url,
@@ -101,11 +102,13 @@ async def create_instance_endpoint(
                 telegram_channel_tg_id=tg_id,
                 auto_reply=form.auto_reply,
                 auto_reply_text=form.auto_reply_text,
-                inst_name=form.inst_name
+                inst_name=form.inst_name,
+                commit=False,
             )
             if not user.full_access and not user.is_owner:
-                user.instances.append(await get_instance_by_api_id(db, api_id=form.api_id))
-                await db.commit()
+                await grant_instance_access(db, user_id=user.id, instance_id=inst.id)
+            # commit here, not in get_session: the tasks below expect the instance to exist
+            await db.commit()
 
             task = asyncio.create_task(update_channel(tg_id))
             task.add_done_callback(
@@ -122,6 +125,7 @@ async def create_instance_endpoint(
                     if t.exception() else None
                 )
         except ValueError as e:
+            await db.rollback()
             raise HTTPException(status_code=400, detail=str(e))
 
 
@@ -193,7 +197,7 @@ async def delete_instance_endpoint(
     if not inst or not has_instance_access(user, inst):
         raise HTTPException(status_code=404, detail="Инстанс не найден")
 
-    await delete_instance(db, instance=inst)
+    await delete_instance(db, instance=inst, commit=False)
 
 
 # EDIT
@@ -278,7 +282,8 @@ async def instance_update(
         telegram_channel_tg_id=tg_id,
         auto_reply=form.auto_reply,
         auto_reply_text=form.auto_reply_text,
-        name=form.inst_name
+        name=form.inst_name,
+        commit=False,
     )
 
     bot_meta = await db.scalar(select(BotMeta).limit(1))
@@ -18,6 +18,7 @@ from fastapi.responses import HTMLResponse
 from pydantic import BaseModel, Field, validator
 from sqlalchemy import update, delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from admin.templating import templates
 from admin.utils.db import get_session
@@ -61,6 +62,10 @@ def _hx_err(msg: str) -> HTMLResponse:
 def _pwd_gen(n: int = 10) -> str:
     return "".join(secrets.choice(string.ascii_letters + string.digits) for _ in range(n))
 
+
+# access list is rendered / replaced by the routes below (User.instances is raise_on_sql)
+_WITH_INSTANCES = (selectinload(User.instances),)
+
 # deps
 def require_manage_users(user: Annotated[User, Depends(require_admin)]) -> User:
     if can_manage_users(user):
@@ -220,6 +225,7 @@ async def users_create(
             can_manage_instances=form.can_manage_instances,
             full_access=form.full_access,
             instance_ids=inst_ids,
+            commit=False,
         )
     except ValueError as exc:
         return _hx_err(str(exc))
@@ -237,7 +243,7 @@ async def user_edit_form(
     db: AsyncSession = Depends(get_session),
     cur: User = Depends(require_admin),
 ):
-    u = await db.get(User, uid)
+    u = await db.get(User, uid, options=_WITH_INSTANCES)
     if not u:
         raise HTTPException(404, "Пользователь не найден")
 
@@ -245,7 +251,7 @@ async def user_edit_form(
     if not can_manage_users(cur) and u.id != cur.id:
         raise HTTPException(403)
 
-    has_foreign_access = not {i.id for i in cur.instances}.issuperset({i.id for i in u.instances})
+    has_foreign_access = not cur.instance_ids.issuperset(i.id for i in u.instances)
 
     insts = await list_instances(db, user=cur)
     return templates.TemplateResponse(
@@ -267,7 +273,7 @@ async def user_update(
     db: AsyncSession = Depends(get_session),
     cur: User = Depends(require_admin),
 ):
-    u = await db.get(User, uid)
+    u = await db.get(User, uid, options=_WITH_INSTANCES)
     if not u:
         raise HTTPException(404)
 
@@ -309,18 +315,18 @@ async def user_update(
             can_manage_instances=form.can_manage_instances,
             full_access=form.full_access,
             instance_ids=form.instance_ids,
+            commit=False,
         )
     except ValueError as exc:
         return _hx_err(str(exc))
 
-    # user changed -> invalidate user sessions
+    # user changed -> invalidate user sessions (same transaction as the update)
     if form.username or form.password1 or form.is_2fa_enabled is not None:
         await db.execute(
             update(DBSession)
             .where(DBSession.user_id == u.id)
             .values(is_active=False)
         )
-        await db.commit()
 
     resp = HTMLResponse("", status_code=201)
     resp.headers["HX-Redirect"] = "/users"
@@ -343,7 +349,7 @@ async def user_delete(
     if u.is_owner:
         raise HTTPException(403, "Владельца удалить нельзя")
 
-    await crud_delete_user(db, user=u)
+    await crud_delete_user(db, user=u, commit=False)
     return HTMLResponse(status_code=204)
 
 
@@ -359,7 +365,6 @@ async def user_logout_sessions(
     await db.execute(
         update(DBSession).where(DBSession.user_id == uid).values(is_active=False)
     )
-    await db.commit()
     return HTMLResponse(status_code=204)
 
 
@@ -371,7 +376,7 @@ async def user_card(
     db: AsyncSession = Depends(get_session),
     cur: User = Depends(require_admin),
 ):
-    u: User | None = await db.get(User, uid)
+    u: User | None = await db.get(User, uid, options=_WITH_INSTANCES)
     if not u:
         raise HTTPException(404, "Пользователь не найден")
 
@@ -4,12 +4,11 @@ from starlette import status
 from admin.utils.logger import logger
 from admin.websockets.manager import WSManager, ChatWSManager
 from admin.utils.security import require_admin, can_manage_users, has_instance_access
-from shared.crud.instance import list_instances, get_instance_by_api_id
+from shared.crud.instance import get_instance_by_api_id
 from shared.crud.session import get_session_by_hash
 
-from hashlib import sha256
-
 from admin.utils.db import async_session_maker
+from admin.utils.sessions import token_digest
 
 
 router = APIRouter()
@@ -26,7 +25,7 @@ async def chat_ws(ws: WebSocket, api_id: int, chat_id: str):
 
     async with async_session_maker() as db:
         inst = await get_instance_by_api_id(db, api_id=api_id)
-        sess = await get_session_by_hash(db, token_hash=sha256(token.encode()).hexdigest())
+        sess = await get_session_by_hash(db, token_hash=token_digest(token))
         user = sess.user if sess else None
         if not inst or not user or not has_instance_access(user, inst):
             return await ws.close(code=status.WS_1008_POLICY_VIOLATION)
@@ -45,7 +44,7 @@ async def ws_users(ws: WebSocket):
     if not token:
         return await ws.close(code=status.WS_1008_POLICY_VIOLATION)
 
-    token_hash = sha256(token.encode()).hexdigest()
+    token_hash = token_digest(token)
     async with async_session_maker() as db:
         sess = await get_session_by_hash(db, token_hash=token_hash)
         if not sess or sess.is_expired() or not sess.is_active:
@@ -68,7 +67,7 @@ async def ws_instances(ws: WebSocket):
     if not token:
         return await ws.close(code=status.WS_1008_POLICY_VIOLATION)
 
-    token_hash = sha256(token.encode()).hexdigest()
+    token_hash = token_digest(token)
 
     async with async_session_maker() as db:
         sess = await get_session_by_hash(db, token_hash=token_hash)
@@ -76,10 +75,7 @@ async def ws_instances(ws: WebSocket):
         if not sess or not user or not sess.is_active or sess.is_expired():
             return await ws.close(code=status.WS_1008_POLICY_VIOLATION)
 
-    allowed_ids = None
-    if not (user.full_access or user.is_owner):
-        insts = await list_instances(db, user=user)
-        allowed_ids = {i.id for i in insts}
+    allowed_ids = None if (user.full_access or user.is_owner) else user.instance_ids
 
     await manager.connect(ws, allowed_ids)
     try:
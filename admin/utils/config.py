@@ -1,3 +1,4 @@
+from functools import cached_property
 from typing import List
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -18,10 +19,10 @@ class Settings(BaseSettings):
 
     WEBHOOK_HOST: str
 
-    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore", frozen=True)
     ALLOW_ORIGINS: List[str] = ["*"]
 
-    @property
+    @cached_property
     def database_url(self) -> str:  # → postgresql+asyncpg://user:pw@host/db
         return (
             f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}"
@@ -9,5 +9,15 @@ engine, async_session_maker = make_async_engine(
 
 
 async def get_session():
+    """
+    One transaction per request: routes call crud helpers with commit=False,
+    whatever is pending is committed once after the handler, rolled back on error
+    """
     async with async_session_maker() as session:
-        yield session
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+        if session.in_transaction():
+            await session.commit()
@@ -75,7 +75,8 @@ async def _save_one_message(
 
     conv = await get_or_create_conversation(db,
                                             instance_id=inst.id, chat_id=chat_id,
-                                            phone=chat_id.split("@")[0], chat_name=chat_id.split("@")[0])
+                                            phone=chat_id.split("@")[0], chat_name=chat_id.split("@")[0],
+                                            commit=False)
 
     db_msg = Message(
         instance_id=inst.id,
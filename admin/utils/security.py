@@ -34,5 +34,4 @@ def has_instance_access(user: User, inst: Instance) -> bool:
     if user.full_access or user.is_owner:
         return True
 
-    allowed_ids = {i.id for i in getattr(user, "instances", [])}
-    return inst.id in allowed_ids
+    return inst.id in (user.instance_ids or ())
@@ -4,9 +4,15 @@ import secrets
 SESSION_BYTES = 32
 
 
-def create_session_tokens() -> tuple[str, str, str]:
+def token_digest(token: str) -> bytes:
+    """ db_sessions.token_hash: raw 32-byte SHA-256 (bytea), not its 64-char hex """
+    return hashlib.sha256(token.encode()).digest()
+
+
+def create_session_tokens() -> tuple[str, bytes, bytes]:
+    """ csrf is raw 16 bytes (db_sessions.csrf_token bytea), pages get its hex """
     plain = secrets.token_urlsafe(SESSION_BYTES)
-    digest = hashlib.sha256(plain.encode()).hexdigest()
-    csrf = secrets.token_hex(16)
+    digest = token_digest(plain)
+    csrf = secrets.token_bytes(16)
 
     return plain, digest, csrf
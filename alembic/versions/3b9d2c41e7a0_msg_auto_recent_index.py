@@ -0,0 +1,32 @@
+"""msg auto recent index
+
+Revision ID: 3b9d2c41e7a0
+Revises: 87629af7f3cf
+Create Date: 2026-10-15 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9d2c41e7a0'
+down_revision: Union[str, None] = '87629af7f3cf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_msg_auto_recent', 'messages', ['instance_id', 'chat_id', 'created_at'], unique=False,
+                    postgresql_using='btree', postgresql_ops={'created_at': 'DESC'},
+                    postgresql_where=sa.text('is_auto'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_msg_auto_recent', table_name='messages',
+                  postgresql_using='btree', postgresql_ops={'created_at': 'DESC'},
+                  postgresql_where=sa.text('is_auto'))
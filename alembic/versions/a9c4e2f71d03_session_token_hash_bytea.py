@@ -0,0 +1,41 @@
+"""session token_hash bytea
+
+Revision ID: a9c4e2f71d03
+Revises: f2b6d8e03a57
+Create Date: 2026-10-15 17:48:55.302714
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9c4e2f71d03'
+down_revision: Union[str, None] = 'f2b6d8e03a57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_INCLUDE = ['id', 'user_id', 'csrf_token', 'is_active', 'last_seen']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # hex text(64) -> raw bytea(32); existing sessions stay valid
+    op.drop_constraint('db_sessions_token_hash_key', 'db_sessions', type_='unique')
+    op.alter_column('db_sessions', 'token_hash',
+                    existing_type=sa.String(length=64), type_=sa.LargeBinary(length=32),
+                    existing_nullable=False, postgresql_using="decode(token_hash, 'hex')")
+    # covering unique index: auth lookup is an index-only scan
+    op.create_index('uq_db_sessions_token_hash', 'db_sessions', ['token_hash'], unique=True,
+                    postgresql_include=_INCLUDE)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_db_sessions_token_hash', table_name='db_sessions', postgresql_include=_INCLUDE)
+    op.alter_column('db_sessions', 'token_hash',
+                    existing_type=sa.LargeBinary(length=32), type_=sa.String(length=64),
+                    existing_nullable=False, postgresql_using="encode(token_hash, 'hex')")
+    op.create_unique_constraint('db_sessions_token_hash_key', 'db_sessions', ['token_hash'])
@@ -0,0 +1,31 @@
+"""drop msg conv_created_desc index
+
+Revision ID: b3e8f1a6c925
+Revises: a9c4e2f71d03
+Create Date: 2026-10-15 18:31:06.774190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e8f1a6c925'
+down_revision: Union[str, None] = 'a9c4e2f71d03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # chat reads go through ix_msg_chat_created, conversation_id lookups (mark seen, FK cascade)
+    # through ix_msg_inc_unseen
+    op.drop_index('ix_msg_conv_created_desc', table_name='messages', postgresql_using='btree',
+                  postgresql_ops={'created_at': 'DESC'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_msg_conv_created_desc', 'messages', ['conversation_id', 'created_at'], unique=False,
+                    postgresql_using='btree', postgresql_ops={'created_at': 'DESC'})
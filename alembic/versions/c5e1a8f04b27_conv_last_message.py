@@ -0,0 +1,65 @@
+"""conv last message
+
+Revision ID: c5e1a8f04b27
+Revises: 3b9d2c41e7a0
+Create Date: 2026-10-15 12:40:08.913254
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e1a8f04b27'
+down_revision: Union[str, None] = '3b9d2c41e7a0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversations', sa.Column('last_message_text', sa.Text(), nullable=True))
+    op.add_column('conversations', sa.Column('last_message_at', sa.DateTime(), nullable=True))
+    op.add_column('conversations', sa.Column(
+        'last_message_direction',
+        postgresql.ENUM('inc', 'out', 'sys', name='messagedirection', create_type=False),
+        nullable=True,
+    ))
+    op.create_index('ix_conv_instance_pinned_last', 'conversations',
+                    ['instance_id', 'pinned', 'last_message_at'], unique=False,
+                    postgresql_using='btree',
+                    postgresql_ops={'pinned': 'DESC', 'last_message_at': 'DESC NULLS LAST'})
+
+    # backfill (new rows are maintained by conv_last_message trigger)
+    op.execute("""
+        UPDATE conversations c
+        SET last_message_text = l.text, last_message_at = l.created_at, last_message_direction = l.direction
+        FROM (
+            SELECT DISTINCT ON (conversation_id) conversation_id, LEFT(text, 512) AS text, created_at, direction
+            FROM messages
+            WHERE conversation_id IS NOT NULL
+            ORDER BY conversation_id, created_at DESC, id DESC
+        ) l
+        WHERE c.id = l.conversation_id
+    """)
+    op.execute("""
+        UPDATE conversations c
+        SET unread_inc_count = COALESCE((
+            SELECT count(*) FROM messages m
+            WHERE m.conversation_id = c.id AND m.direction = 'inc' AND m.is_seen IS FALSE
+        ), 0)
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS trg_conv_last_message ON messages")
+    op.execute("DROP FUNCTION IF EXISTS conv_last_message()")
+    op.drop_index('ix_conv_instance_pinned_last', table_name='conversations',
+                  postgresql_using='btree',
+                  postgresql_ops={'pinned': 'DESC', 'last_message_at': 'DESC NULLS LAST'})
+    op.drop_column('conversations', 'last_message_direction')
+    op.drop_column('conversations', 'last_message_at')
+    op.drop_column('conversations', 'last_message_text')
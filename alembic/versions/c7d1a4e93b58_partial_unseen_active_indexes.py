@@ -0,0 +1,38 @@
+"""partial unseen / active indexes
+
+Revision ID: c7d1a4e93b58
+Revises: b3e8f1a6c925
+Create Date: 2026-10-15 19:04:52.118346
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d1a4e93b58'
+down_revision: Union[str, None] = 'b3e8f1a6c925'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_index('ix_msg_inc_unseen', table_name='messages')
+    op.create_index('ix_msg_unseen_inc', 'messages', ['conversation_id'], unique=False,
+                    postgresql_where=sa.text("is_seen IS FALSE AND direction = 'inc'"))
+    op.drop_index('ix_conv_instance_arch_updated', table_name='conversations')
+    op.create_index('ix_conv_active', 'conversations', ['instance_id', 'updated_at'], unique=False,
+                    postgresql_where=sa.text('is_archived IS FALSE'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_conv_active', table_name='conversations', postgresql_where=sa.text('is_archived IS FALSE'))
+    op.create_index('ix_conv_instance_arch_updated', 'conversations', ['instance_id', 'is_archived', 'updated_at'],
+                    unique=False)
+    op.drop_index('ix_msg_unseen_inc', table_name='messages',
+                  postgresql_where=sa.text("is_seen IS FALSE AND direction = 'inc'"))
+    op.create_index('ix_msg_inc_unseen', 'messages', ['conversation_id', 'is_seen', 'direction'], unique=False)
@@ -0,0 +1,34 @@
+"""session csrf_token bytea
+
+Revision ID: d4f9b2c61e87
+Revises: c7d1a4e93b58
+Create Date: 2026-10-15 19:37:14.650231
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4f9b2c61e87'
+down_revision: Union[str, None] = 'c7d1a4e93b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # hex text(32) -> raw bytea(16); pages keep receiving the same hex, open forms stay valid
+    # (uq_db_sessions_token_hash INCLUDEs the column, ALTER TYPE rebuilds it)
+    op.alter_column('db_sessions', 'csrf_token',
+                    existing_type=sa.String(length=32), type_=sa.LargeBinary(length=16),
+                    existing_nullable=False, postgresql_using="decode(csrf_token, 'hex')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('db_sessions', 'csrf_token',
+                    existing_type=sa.LargeBinary(length=16), type_=sa.String(length=32),
+                    existing_nullable=False, postgresql_using="encode(csrf_token, 'hex')")
@@ -0,0 +1,35 @@
+"""msg keyset index
+
+Revision ID: d8f3b6a21c94
+Revises: c5e1a8f04b27
+Create Date: 2026-10-15 14:05:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8f3b6a21c94'
+down_revision: Union[str, None] = 'c5e1a8f04b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # (created_at, id) seek pagination of a chat; old index is a prefix of the new one
+    op.create_index('ix_msg_chat_created', 'messages', ['instance_id', 'chat_id', 'created_at', 'id'],
+                    unique=False, postgresql_using='btree',
+                    postgresql_ops={'created_at': 'DESC', 'id': 'DESC'})
+    op.drop_index('ix_msg_conv', table_name='messages', postgresql_using='btree',
+                  postgresql_ops={'created_at': 'DESC'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_msg_conv', 'messages', ['instance_id', 'chat_id', 'created_at'], unique=False,
+                    postgresql_using='btree', postgresql_ops={'created_at': 'DESC'})
+    op.drop_index('ix_msg_chat_created', table_name='messages', postgresql_using='btree',
+                  postgresql_ops={'created_at': 'DESC', 'id': 'DESC'})
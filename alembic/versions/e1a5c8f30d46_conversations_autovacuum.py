@@ -0,0 +1,30 @@
+"""conversations autovacuum
+
+Revision ID: e1a5c8f30d46
+Revises: d4f9b2c61e87
+Create Date: 2026-10-15 20:02:41.907315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a5c8f30d46'
+down_revision: Union[str, None] = 'd4f9b2c61e87'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # conv_last_message / mark-seen update a conversation row per message: vacuum (and refresh the
+    # visibility map) long before the default 20% of the table is dead
+    op.execute("ALTER TABLE conversations SET (autovacuum_vacuum_scale_factor = 0.02, "
+               "autovacuum_analyze_scale_factor = 0.05)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE conversations RESET (autovacuum_vacuum_scale_factor, autovacuum_analyze_scale_factor)")
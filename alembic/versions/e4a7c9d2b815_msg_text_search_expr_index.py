@@ -0,0 +1,38 @@
+"""msg text_search expression index
+
+Revision ID: e4a7c9d2b815
+Revises: d8f3b6a21c94
+Create Date: 2026-10-15 16:20:47.118530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c9d2b815'
+down_revision: Union[str, None] = 'd8f3b6a21c94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # GIN on the expression itself instead of a stored generated tsvector column + GIN on it
+    op.drop_index('ix_msg_text_search', table_name='messages', postgresql_using='gin')
+    op.drop_column('messages', 'text_search')
+    op.create_index('ix_msg_text_search', 'messages',
+                    [sa.text("to_tsvector('russian'::regconfig, coalesce(text, ''))")],
+                    unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_msg_text_search', table_name='messages', postgresql_using='gin')
+    op.add_column('messages', sa.Column('text_search', postgresql.TSVECTOR(),
+                                        sa.Computed("to_tsvector('russian', coalesce(text, ''))", persisted=True),
+                                        nullable=True))
+    op.create_index('ix_msg_text_search', 'messages', ['text_search'], unique=False, postgresql_using='gin')
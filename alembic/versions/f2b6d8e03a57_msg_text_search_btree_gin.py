@@ -0,0 +1,37 @@
+"""msg text_search btree_gin index
+
+Revision ID: f2b6d8e03a57
+Revises: e4a7c9d2b815
+Create Date: 2026-10-15 17:02:13.540281
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b6d8e03a57'
+down_revision: Union[str, None] = 'e4a7c9d2b815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # btree_gin: GIN operator class for plain scalars (instance_id) next to the tsvector
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    op.drop_index('ix_msg_text_search', table_name='messages', postgresql_using='gin')
+    op.create_index('ix_msg_text_search', 'messages',
+                    ['instance_id', sa.text("to_tsvector('russian'::regconfig, coalesce(text, ''))")],
+                    unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # extension is left installed (harmless, may be used by other objects)
+    op.drop_index('ix_msg_text_search', table_name='messages', postgresql_using='gin')
+    op.create_index('ix_msg_text_search', 'messages',
+                    [sa.text("to_tsvector('russian'::regconfig, coalesce(text, ''))")],
+                    unique=False, postgresql_using='gin')
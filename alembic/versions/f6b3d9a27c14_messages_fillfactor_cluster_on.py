@@ -0,0 +1,33 @@
+"""messages fillfactor / cluster on
+
+Revision ID: f6b3d9a27c14
+Revises: e1a5c8f30d46
+Create Date: 2026-10-15 20:41:09.386520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6b3d9a27c14'
+down_revision: Union[str, None] = 'e1a5c8f30d46'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # free space per page for HOT updates of status (sent -> delivered -> read acks, no index on it);
+    # applies to pages written from now on
+    op.execute("ALTER TABLE messages SET (fillfactor = 85)")
+    # only marks the index, no lock / rewrite here; a plain `CLUSTER messages;` during maintenance
+    # then lays each chat's messages out in keyset pagination order
+    op.execute("ALTER TABLE messages CLUSTER ON ix_msg_chat_created")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE messages SET WITHOUT CLUSTER")
+    op.execute("ALTER TABLE messages RESET (fillfactor)")
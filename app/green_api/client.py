@@ -4,9 +4,10 @@ import asyncio, random
 from collections import defaultdict
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Any, Final
+from typing import Any, AsyncIterable, Final
 
 import aiohttp
+import orjson
 from aiolimiter import AsyncLimiter
 from pydantic import TypeAdapter, BaseModel
 
@@ -140,11 +141,14 @@ class GreenAPIClient:
             self,
             *,
             chat_id: str,
-            file_bytes: bytes,
+            file_bytes: bytes | AsyncIterable[bytes],
             filename: str,
             mime: str,
             caption: str = "",
     ) -> _json:
+        """
+        file_bytes may be an async chunk iterator -> body is streamed (chunked), not buffered
+        """
         form = aiohttp.FormData()
         form.add_field("chatId", chat_id)
         form.add_field("fileName", filename)
@@ -185,7 +189,7 @@ class GreenAPIClient:
                 if r.status >= 400:
                     raise GreenAPIError(f"GREEN-API {r.status}: {await r.text()}")
 
-                result = await r.json()
+                result = await r.json(loads=orjson.loads)
 
         return result
 
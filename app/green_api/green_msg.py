@@ -14,6 +14,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.loader import logger
 from shared.crud.conversations import get_or_create_conversation
 from shared.models import (
+    Instance,
     Message, MessageDirection, MessageStatus, MessageType,
     MessageFile, FileType,
 )
@@ -109,18 +110,29 @@ def _contact_to_text(d: dict) -> str:
     return f"<контакт>\n{name}:\n{phones}"
 
 
+async def bind_conversation(session: AsyncSession, msg: Message) -> None:
+    """
+    Sets msg.conversation_id (creates Conversation if needed)
+    """
+    phone = msg.chat_id.rsplit("@", 1)[0]
+    conv = await get_or_create_conversation(session,
+                                            instance_id=msg.instance_id, chat_id=msg.chat_id,
+                                            phone=phone, chat_name=msg.chat_name)
+    msg.conversation_id = conv.id
+
+
 # ! ENTRY POINT
 async def payload_to_msg(
     payload: dict[str, Any],
-    session: AsyncSession,
     *,
-    db_instance_id: int,
+    db_instance: Instance,
     im,                       # ClientManager (no type, so no dependencies here, do not fix in the future)
     incoming: bool = True,
     archived: bool = False
 ) -> Message | None:
     """
-    Processes GreenAPI payload into ORM Message obj
+    Processes GreenAPI payload into ORM Message obj, downloads media
+    Doesn't touch DB: call bind_conversation() inside the saving session
     """
     mdata = payload["messageData"]
     mtype = mdata["typeMessage"]
@@ -135,13 +147,8 @@ async def payload_to_msg(
     #if gtype.strip() == "g.us":
     #    chat_name += " (group)"
 
-    conv = await get_or_create_conversation(session,
-                                            instance_id=db_instance_id, chat_id=chat_id,
-                                            phone=phone, chat_name=chat_name)
-
     msg = Message(
-        instance_id=db_instance_id,
-        conversation_id=conv.id,
+        instance_id=db_instance.id,
         wa_message_id=payload["idMessage"],
         chat_id=chat_id,
         chat_name=chat_name,
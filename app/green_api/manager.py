@@ -2,10 +2,10 @@ from __future__ import annotations
 
 import asyncio
 from contextlib import asynccontextmanager, suppress
-from typing import AsyncIterator
+from typing import AsyncIterator, Final
 
 import aiohttp
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from .client import GreenAPIClient
@@ -15,6 +15,11 @@ from app.utils.config import settings
 from ..loader import logger
 
 
+_CONN_LIMIT: Final = 200
+_CONN_LIMIT_PER_HOST: Final = 32
+_SYNC_BATCH: Final = 100            # instances per fetch in _sync_with_db
+
+
 class ClientManager:
     """
     Caches GreenAPIClients (key - api_id)
@@ -81,18 +86,41 @@ class ClientManager:
     async def get_client(self, api_id: int) -> AsyncIterator[GreenAPIClient]:
         if api_id not in self._clients:
             await self._bootstrap(api_id)  # on request
-        yield self._clients[api_id]
+        cli = self._clients[api_id]
+        await self._ensure_session()
+        if cli.session is not self._session:  # session was re-created -> rebind, don't keep a closed one
+            cli._session = self._session
+        yield cli
+
+    @property
+    def session(self) -> aiohttp.ClientSession | None:
+        """Shared aiohttp session (one pool for all instances)"""
+        return self._session
 
     # internals
 
     async def _ensure_session(self) -> None:
         if not self._session or self._session.closed:
-            self._session = aiohttp.ClientSession()
+            # few hosts (api./media.green-api.com) -> per-host pool + DNS cache
+            connector = aiohttp.TCPConnector(
+                limit=_CONN_LIMIT,
+                limit_per_host=_CONN_LIMIT_PER_HOST,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+                enable_cleanup_closed=True,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=30, connect=5),
+            )
 
     async def _sync_with_db(self) -> None:
         async with self._db_factory() as db:
-            rows = await db.scalars(select(Instance))
-            actual = {r.api_id: r for r in rows}
+            # server-side cursor, plain columns only
+            rows = await db.stream_scalars(
+                select(Instance).execution_options(yield_per=_SYNC_BATCH)
+            )
+            actual = {r.api_id: r async for r in rows}
 
         for api_id in set(self._clients) - set(actual):
             self._log.info("Drop client %s (row removed)", api_id)
@@ -112,7 +140,9 @@ class ClientManager:
 
         if fresh is None:
             async with self._db_factory() as db:
-                fresh = await db.scalar(select(Instance).where(Instance.api_id == api_id).limit(1))
+                fresh = await db.scalar(
+                    select(Instance).where(Instance.api_id == api_id).limit(1)
+                )
             if fresh is None:
                 self._log.warning("Instance %s disappeared before bootstrap", api_id)
                 return
@@ -142,7 +172,7 @@ class ClientManager:
 
     # update Instance.state / phone / avatar
     async def _sync_state(self, cli: GreenAPIClient, row: Instance) -> None:
-        modified = False
+        changes: dict[str, object] = {}
         try:
             state = InstanceState(await cli.get_state())
         except GreenAPIThrottleError:
@@ -153,35 +183,34 @@ class ClientManager:
             state = InstanceState.unknown
 
         if row.state != state:
-            row.state = state
-            modified = True
+            changes["state"] = state
 
         if state == InstanceState.authorized:
             try:
                 wa = await cli.get_settings()
                 phone = wa.get("wid").rsplit("@", 1)[0]
                 if row.phone != phone:
-                    row.phone = phone
-                    modified = True
+                    changes["phone"] = phone
                 """if row.photo_url != "photo_url":
-                    row.photo_url = "photo_url"
-                    modified = True"""
+                    changes["photo_url"] = "photo_url" """
             except Exception as e:
                 self._log.error("get_settings failed for %s: %s", row.api_id, e)
 
         else:  # not authorised -> clears the data
             if row.phone or row.photo_url:
-                row.phone = row.photo_url = None
-                modified = True
+                changes["phone"] = changes["photo_url"] = None
 
         # webhook setup guaranteed if GAPI is available
         if state != InstanceState.unknown:
             await self._ensure_webhook(cli, row)
 
-        if modified:
+        if changes:
+            # row comes from a closed session -> plain UPDATE by api_id, no re-attach
             async with self._db_factory() as db:
-                db.add(row)
+                await db.execute(update(Instance).where(Instance.api_id == row.api_id).values(**changes))
                 await db.commit()
+            for k, v in changes.items():
+                setattr(row, k, v)
 
     # context manager
     @asynccontextmanager
@@ -189,8 +218,12 @@ class ClientManager:
         lock = self._history_lock.setdefault(api_id, asyncio.Lock())
         if lock.locked():
             raise RuntimeError("history task already running for this instance")
-        async with lock:
-            yield
+        try:
+            async with lock:
+                yield
+        finally:
+            if not lock.locked():
+                self._history_lock.pop(api_id, None)
 
     # webhook
     async def _ensure_webhook(self, g_client: GreenAPIClient, row: Instance) -> None:
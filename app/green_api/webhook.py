@@ -7,13 +7,15 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any, Final, Callable, Awaitable
 
+import orjson
 from aiohttp import ClientSession, web
-from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from app.green_api.green_msg import payload_to_msg
+from app.green_api.green_msg import bind_conversation, payload_to_msg
+from app.listeners.msg_in_listener import cache_instance
 from app.loader import app, bot, logger
 from app.utils.db import async_session_maker
 from app.utils.messages import notify_send_error
@@ -31,11 +33,23 @@ MEDIA_ROOT: Final = Path(os.getenv("MEDIA_ROOT", "/app/media"))
 
 _HANDLERS: dict[str, Callable[[dict[str, Any]], Awaitable[None]]] = {}
 
+# fire-and-forget Telegram notifications (strong refs until done, bounded concurrency)
+_notify_sem: Final = asyncio.Semaphore(64)
+_notify_tasks: set[asyncio.Task] = set()
 
-async def resolve_internal_id(api_id: int, session: AsyncSession) -> int | None:
-    return await session.scalar(
-        select(Instance.id).where(Instance.api_id == api_id)
+
+async def resolve_instance(api_id: int, session: AsyncSession) -> Instance | None:
+    """
+    Instance (+ telegram_channel) by GAPI id, other relations are not loaded
+    """
+    inst = await session.scalar(
+        select(Instance)
+        .options(selectinload(Instance.telegram_channel))
+        .where(Instance.api_id == api_id)
     )
+    if inst is not None:
+        cache_instance(inst)
+    return inst
 
 
 def handler(kind: str):
@@ -47,7 +61,31 @@ def handler(kind: str):
 
 
 # helpers
+def _row_values(obj: Message | MessageFile, **extra: Any) -> dict[str, Any]:
+    """ Set (not None) column values of transient ORM obj, defaults fill the rest """
+    return {
+        c.key: v for c in obj.__table__.c
+        if c.key != "id" and c.computed is None and (v := getattr(obj, c.key)) is not None
+    } | extra
 
+
+async def _insert_msg(db: AsyncSession, msg: Message) -> int | None:
+    """
+    INSERT ... ON CONFLICT (instance_id, wa_message_id) DO NOTHING RETURNING id (+ files)
+    None -> duplicate webhook
+    """
+    msg_id = await db.scalar(
+        pg_insert(Message)
+        .values(**_row_values(msg))
+        .on_conflict_do_nothing(index_elements=["instance_id", "wa_message_id"])
+        .returning(Message.id)
+    )
+    if msg_id is not None and msg.files:
+        await db.execute(insert(MessageFile), [_row_values(f, message_id=msg_id) for f in msg.files])
+    return msg_id
+
+
+# only statuses Green API reports for sent messages; "pending" etc. must not overwrite sent / delivered
 _STATUS2ENUM = {
     "sent": MessageStatus.sent,
     "delivered": MessageStatus.delivered,
@@ -77,7 +115,7 @@ async def _handle_call(payload: dict[str, Any]) -> None:
     wa_id = payload["idMessage"]
     chat_id = payload["from"]
     status = payload["status"]  # offer / pickUp
-    phone, gtype = chat_id.rsplit("@", 1)
+    phone, _, gtype = chat_id.partition("@")
     chat_name = phone
     if gtype.strip() == "g.us":
         chat_name += " (group)"
@@ -85,43 +123,34 @@ async def _handle_call(payload: dict[str, Any]) -> None:
     human = _CALL_STATUS_HUMAN.get(status, status)
 
     async with async_session_maker() as db:
-        inst_db_id = await resolve_internal_id(inst_id, db)
-        if inst_db_id is None:
+        inst = await resolve_instance(inst_id, db)
+        if inst is None:
             logger.warning("Webhook for unknown instance %s – ignore", inst_id)
             return
 
-        row = await db.scalar(
-            select(Message)
-            .where(Message.instance_id == inst_db_id,
-                   Message.wa_message_id == wa_id)
-        )
-
         conv = await get_or_create_conversation(db,
-                                                instance_id=inst_db_id, chat_id=chat_id,
-                                                phone=chat_id.split("@")[0], chat_name=chat_id.split("@")[0])
-
-        if row is None:  # offer stage
-            msg = Message(
-                instance_id=inst_db_id,
-                conversation_id=conv.id,
-                wa_message_id=wa_id,
-                chat_id=chat_id,
-                chat_name=chat_name,
-                from_app=False,
-                direction=MessageDirection.inc,
-                status=MessageStatus.incoming,
-                message_type=MessageType.call,
-                text=f"📞 {human}",
-            )
-            db.add(msg)
-
-        else:          # final status
-            row.text = f"📞 {human}"
-
-        try:
-            await db.commit()
-        except IntegrityError:
-            await db.rollback()
+                                                instance_id=inst.id, chat_id=chat_id,
+                                                phone=phone, chat_name=phone, commit=False)
+
+        # offer stage inserts the row, final status (pickUp / missed / ...) only rewrites its text:
+        # one upsert instead of SELECT + ORM INSERT / UPDATE, concurrent webhooks can't collide
+        ins = pg_insert(Message).values(
+            instance_id=inst.id,
+            conversation_id=conv.id,
+            wa_message_id=wa_id,
+            chat_id=chat_id,
+            chat_name=chat_name,
+            from_app=False,
+            direction=MessageDirection.inc,
+            status=MessageStatus.incoming,
+            message_type=MessageType.call,
+            text=f"📞 {human}",
+        )
+        await db.execute(
+            ins.on_conflict_do_update(index_elements=["instance_id", "wa_message_id"],
+                                      set_={"text": ins.excluded.text})
+        )
+        await db.commit()
 
 
 @handler("outgoingMessageReceived")
@@ -132,14 +161,14 @@ async def _handle_outgoing(payload: dict[str, Any]) -> None:
 
     # early return
     async with async_session_maker() as db:
-        inst_db_id = await resolve_internal_id(inst_id, db)
-        if inst_db_id is None:
+        inst = await resolve_instance(inst_id, db)
+        if inst is None:
             logger.warning("Webhook for unknown instance %s – ignore", inst_id)
             return
 
         exists = await db.scalar(
             select(Message.id).where(
-                Message.instance_id == inst_db_id,
+                Message.instance_id == inst.id,
                 Message.wa_message_id == wa_id,
             )
         )
@@ -147,21 +176,22 @@ async def _handle_outgoing(payload: dict[str, Any]) -> None:
             logger.debug("Dup OUT msg %s – skip download/parse", wa_id)
             return  # skip the dupe
 
-        # process payload as ORM obj, download media
-        msg = await payload_to_msg(payload, db, im=app["client_manager"], db_instance_id=inst_db_id, incoming=False)
-        if msg is None:  # _IGNORE_MTYPE
-            return
+    # process payload as ORM obj, download media (no DB connection held meanwhile)
+    msg = await payload_to_msg(payload, im=app["client_manager"], db_instance=inst, incoming=False)
+    if msg is None:  # _IGNORE_MTYPE
+        return
 
-        msg.direction = MessageDirection.out
-        msg.from_app = False
+    msg.direction = MessageDirection.out
+    msg.from_app = False
 
-        # attempt to save
-        try:
-            db.add(msg)
-            await db.commit()
-            logger.info("Saved OUT msg %s / %s", inst_id, wa_id)
-        except IntegrityError:  # race condition: 2 webhooks at the same time (fixes high-demand instance errors)
+    async with async_session_maker() as db:
+        await bind_conversation(db, msg)
+        # race condition: 2 webhooks at the same time -> unique constraint wins, no rollback
+        if await _insert_msg(db, msg) is None:
             logger.debug("Race dup on %s – unique constraint won", wa_id)
+            return
+        await db.commit()
+        logger.info("Saved OUT msg %s / %s", inst_id, wa_id)
 
 
 @handler("outgoingMessageStatus")
@@ -170,19 +200,19 @@ async def _handle_status(payload: dict[str, Any]) -> None:
     inst_id = payload["instanceData"]["idInstance"]
     wa_id = payload["idMessage"]
     new_st = _STATUS2ENUM.get(payload.get("status"))
-    if not new_st:
+    if new_st is None:
         logger.debug("Unknown status %s; skip", payload.get("status"))
         return
 
     async with async_session_maker() as db:
-        inst_db_id = await resolve_internal_id(inst_id, db)
-        if inst_db_id is None:
+        inst = await resolve_instance(inst_id, db)
+        if inst is None:
             logger.warning("Webhook for unknown instance %s – ignore", inst_id)
             return
 
         msg: Message | None = await db.scalar(
             select(Message).where(
-                Message.instance_id == inst_db_id,
+                Message.instance_id == inst.id,
                 Message.wa_message_id == wa_id,
             )
         )
@@ -199,6 +229,14 @@ async def _handle_status(payload: dict[str, Any]) -> None:
         logger.info("Msg %s → %s", wa_id, new_st.value)
 
 
+async def _notify_state(chat_id: int, inst_id: int, old: str, new: str) -> None:
+    async with _notify_sem:
+        try:
+            await bot.send_message(chat_id, f"Статус инстанса {inst_id}: {old} → {new}")
+        except Exception as e:
+            logger.error("Telegram notify failed: %s", e)
+
+
 @handler("stateInstanceChanged")
 async def _handle_state(payload: dict[str, Any]) -> None:
     inst_id = payload["instanceData"]["idInstance"]
@@ -211,7 +249,7 @@ async def _handle_state(payload: dict[str, Any]) -> None:
         return
 
     async with async_session_maker() as db:
-        inst = await db.scalar(select(Instance).options(selectinload(Instance.telegram_channel)).where(Instance.api_id == inst_id))
+        inst = await resolve_instance(inst_id, db)
         if not inst:
             logger.error("Instance %s not found in DB", inst_id)
             return
@@ -221,39 +259,46 @@ async def _handle_state(payload: dict[str, Any]) -> None:
             inst.state = new_state
             await db.commit()
             logger.info("Instance %s: %s → %s", inst_id, old.value, new_state.value)
-            try:
-                await bot.send_message(inst.telegram_channel.telegram_id,
-                                       f"Статус инстанса {inst_id}: {old.value} → {new_state.value}")
-            except Exception as e:
-                logger.error("Telegram notify failed: %s", e)
+            # don't hold the webhook response for Telegram RTT
+            task = asyncio.create_task(
+                _notify_state(inst.telegram_channel.telegram_id, inst_id, old.value, new_state.value)
+            )
+            _notify_tasks.add(task)
+            task.add_done_callback(_notify_tasks.discard)
 
 
 @handler("incomingMessageReceived")
 async def _handle_incoming(payload: dict[str, Any]) -> None:
     inst_id = payload["instanceData"]["idInstance"]
     async with async_session_maker() as db:
-        inst_db_id = await resolve_internal_id(inst_id, db)
-        if inst_db_id is None:
-            logger.warning("Webhook for unknown instance %s – ignore", inst_id)
-            return
+        inst = await resolve_instance(inst_id, db)
+    if inst is None:
+        logger.warning("Webhook for unknown instance %s – ignore", inst_id)
+        return
 
-        msg = await payload_to_msg(payload, db, im=app["client_manager"], db_instance_id=inst_db_id)
-        if not msg:
-            logger.info("Ignored msg %s of type: %s", msg.wa_message_id,
-                        str(payload.get("messageData", {}).get("typeMessage", "unknown type")))
-            return
-        try:
-            db.add(msg)
-            await db.commit()
-            logger.info("Saved msg %s / %s", msg.instance_id, msg.wa_message_id)
-        except IntegrityError:
-            await db.rollback()
+    # media download happens here, no DB connection held meanwhile
+    msg = await payload_to_msg(payload, im=app["client_manager"], db_instance=inst)
+    if not msg:
+        logger.info("Ignored msg %s of type: %s", payload.get("idMessage"),
+                    str(payload.get("messageData", {}).get("typeMessage", "unknown type")))
+        return
+
+    async with async_session_maker() as db:
+        await bind_conversation(db, msg)
+        if await _insert_msg(db, msg) is None:
             logger.warning("Dup webhook skipped (%s, %s)", msg.instance_id, msg.wa_message_id)
+            return
+        await db.commit()
+        logger.info("Saved msg %s / %s", msg.instance_id, msg.wa_message_id)
 
 
 @routes.post("/green-api/webhook/")
 async def green_webhook(req: web.Request) -> web.Response:
-    payload = await req.json()
+    try:
+        payload = orjson.loads(await req.read())
+    except orjson.JSONDecodeError:
+        logger.warning("Malformed webhook body skipped")
+        return web.Response(status=400)
     #logger.info(json.dumps(payload))
     fn = _HANDLERS.get(payload.get("typeWebhook"))
     if fn:
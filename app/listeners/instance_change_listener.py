@@ -1,10 +1,10 @@
 from __future__ import annotations
 
 import asyncio
-import json
 from typing import Final
 
 import asyncpg
+import orjson
 
 from app.green_api.manager import ClientManager
 from app.loader import logger
@@ -15,6 +15,25 @@ from app.utils.config import settings
 _INSERT: Final = {"insert", "update"}
 _DELETE: Final = {"delete"}
 
+# debounce for bursts of NOTIFY on the same row (bulk admin updates)
+_DEBOUNCE: Final = 0.2              # seconds
+_MAX_REFRESH: Final = 8             # concurrent _bootstrap-s
+_pending: dict[int, asyncio.Task] = {}
+_refresh_sem = asyncio.Semaphore(_MAX_REFRESH)
+
+
+async def _debounced(manager: ClientManager, row_id: int) -> None:
+    """
+    Waits for the burst to settle, then refreshes the row once.
+    Notifications arriving while refresh is running schedule a new one.
+    """
+    try:
+        await asyncio.sleep(_DEBOUNCE)
+    finally:
+        _pending.pop(row_id, None)
+    async with _refresh_sem:
+        await manager.refresh_instance(row_id)
+
 
 async def instance_listener(
     manager: ClientManager,
@@ -23,7 +42,7 @@ async def instance_listener(
     """
     On instances change.
 
-    - insert / update -> manager.refresh_instance(row_id)
+    - insert / update -> manager.refresh_instance(row_id), debounced per row
     - delete -> manager.drop_client(api_id)
     """
     pg = await asyncpg.connect(
@@ -36,15 +55,18 @@ async def instance_listener(
 
     async def _handler(_, __, ___, payload: str) -> None:
         try:
-            data = json.loads(payload)
+            data = orjson.loads(payload)
             action: str = data["action"]
-        except (json.JSONDecodeError, KeyError):
+        except (orjson.JSONDecodeError, KeyError):
             logger.warning("instance_listener: malformed payload «%s»", payload)
             return
 
         if action in _INSERT:
             row_id = data["id"]
-            asyncio.create_task(manager.refresh_instance(row_id))
+            if row_id in _pending:
+                logger.debug("instance_listener: refresh %s already pending (%s)", row_id, action)
+                return
+            _pending[row_id] = asyncio.create_task(_debounced(manager, row_id))
             logger.debug("instance_listener: refresh %s (%s)", row_id, action)
 
         elif action in _DELETE:
@@ -63,4 +85,6 @@ async def instance_listener(
     finally:
         await pg.remove_listener("instance_change", _handler)
         await pg.close()
+        for task in list(_pending.values()):
+            task.cancel()
         logger.info("LISTEN instance_change — stopped")
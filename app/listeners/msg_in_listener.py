@@ -1,23 +1,31 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+from datetime import timedelta
 import asyncio
-import json
+from collections import OrderedDict
 import pathlib
+import time
+from functools import lru_cache
 from html import escape
 from typing import Final
 
+import aiofiles
+import aiofiles.os
 import asyncpg
+import orjson
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import (
+    BufferedInputFile,
     FSInputFile,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     InputFile,
+    InputMediaDocument,
     Message as TgMsg,
 )
-from sqlalchemy import select, update
-from sqlalchemy.orm import selectinload
+from sqlalchemy import DateTime, exists, func, insert, literal, select, update
+from sqlalchemy.orm import joinedload, selectinload
 
 from app.loader import bot, logger
 from app.utils.config import settings
@@ -34,13 +42,58 @@ from shared.utils import stringify
 from shared import locale as L
 
 
+_URL_TMPL: Final = f"https://{settings.WEBHOOK_HOST}/chat/{{api_id}}/{{phone}}"
+_MEDIA_GROUP_MAX: Final = 10  # Bot API limit for send_media_group
+
+# in-memory bytes of small files (LRU, (path, mtime) -> bytes)
+_BUF_FILE_MAX: Final = 4 * 1024 * 1024
+_FILE_CACHE_BUDGET: Final = 64 * 1024 * 1024
+_file_cache: OrderedDict[tuple[str, int], bytes] = OrderedDict()
+_file_cache_bytes = 0
+
+# short-lived Instance cache, webhook fills it right before INSERT -> NOTIFY msg_in
+_INST_TTL: Final = 5.0  # seconds
+_inst_cache: dict[int, tuple[Instance, float]] = {}
+
+
+def cache_instance(inst: Instance) -> None:
+    """Remembers Instance (with telegram_channel loaded) for _INST_TTL seconds"""
+    _inst_cache[inst.id] = (inst, time.monotonic())
+
+
+async def _get_instance(db, inst_id: int) -> Instance | None:
+    cached = _inst_cache.get(inst_id)
+    if cached and time.monotonic() - cached[1] < _INST_TTL:
+        return cached[0]
+
+    inst = await db.scalar(
+        select(Instance)
+        .options(selectinload(Instance.telegram_channel))
+        .where(Instance.id == inst_id)
+    )
+    if inst is not None:
+        cache_instance(inst)
+    return inst
+
+
 # helpers
+def _utc_now():
+    """ DB-side utcnow (created_at is naive UTC) """
+    return func.timezone("utc", func.now(), type_=DateTime())
+
+
 def _phone(chat_id: str) -> str:
-    return chat_id.split("@", 1)[0].lstrip("+")
+    return chat_id.partition("@")[0].lstrip("+")
 
 
 def _make_kb(inst: Instance, chat_id_wa: str) -> InlineKeyboardMarkup:
-    phone, suffix = chat_id_wa.rsplit("@", 1)        # 79991112233, c.us / g.us
+    return _kb(inst.api_id, chat_id_wa)
+
+
+@lru_cache(maxsize=2048)
+def _kb(api_id: int, chat_id_wa: str) -> InlineKeyboardMarkup:
+    """ Keyboard depends only on (api_id, chat_id) -> built once per chat """
+    phone, _, suffix = chat_id_wa.rpartition("@")     # 79991112233, c.us / g.us
     if suffix == "g.us":
         phone += "-g"
 
@@ -48,7 +101,7 @@ def _make_kb(inst: Instance, chat_id_wa: str) -> InlineKeyboardMarkup:
         inline_keyboard=[[
             InlineKeyboardButton(
                 text=phone,
-                url=f"https://{settings.WEBHOOK_HOST}/chat/{inst.api_id}/{phone}",
+                url=_URL_TMPL.format_map({"api_id": api_id, "phone": phone}),
             )
         ]]
     )
@@ -61,8 +114,33 @@ def _pretty_caption(msg: Message) -> str:
     return stringify(L.NEW_MESSAGE, name=name, phone=phone, text=txt)
 
 
-def _tg_file(rec: MessageFile) -> InputFile:
-    return FSInputFile(pathlib.Path(rec.file_path), filename=rec.name)
+async def _tg_file(rec: MessageFile) -> InputFile:
+    """
+    Small files are read with aiofiles (off the event loop) and kept in memory,
+    big ones are streamed by aiogram as before
+    """
+    st = await aiofiles.os.stat(rec.file_path)
+    if st.st_size >= _BUF_FILE_MAX:
+        return FSInputFile(pathlib.Path(rec.file_path), filename=rec.name)
+
+    key = (rec.file_path, st.st_mtime_ns)
+    data = _file_cache.get(key)
+    if data is None:
+        async with aiofiles.open(rec.file_path, "rb") as f:
+            data = await f.read()
+        _cache_file(key, data)
+    else:
+        _file_cache.move_to_end(key)
+    return BufferedInputFile(data, filename=rec.name)
+
+
+def _cache_file(key: tuple[str, int], data: bytes) -> None:
+    global _file_cache_bytes
+    _file_cache[key] = data
+    _file_cache_bytes += len(data)
+    while _file_cache_bytes > _FILE_CACHE_BUDGET:
+        _, old = _file_cache.popitem(last=False)
+        _file_cache_bytes -= len(old)
 
 
 # listener
@@ -81,17 +159,19 @@ async def msg_inbox(stop: asyncio.Event) -> None:
     )
 
     async def _handler(_, __, ___, payload: str) -> None:  # noqa: ANN001
-        msg_id = json.loads(payload)["msg_id"]
+        # statement-level trigger: all ids inserted by one statement, in order
+        data = orjson.loads(payload)
+        for msg_id in data.get("msg_ids") or (data["msg_id"],):
+            await _handle_one(msg_id)
 
+    async def _handle_one(msg_id: int) -> None:
         async with async_session_maker() as db:
-            msg: Message | None = await db.scalar(
+            # single row -> LEFT JOIN files in the same query (no second SELECT)
+            msg: Message | None = (await db.execute(
                 select(Message)
                 .where(Message.id == msg_id)
-                .options(
-                    selectinload(Message.instance).selectinload(Instance.telegram_channel),
-                    selectinload(Message.files),
-                )
-            )
+                .options(joinedload(Message.files))
+            )).unique().scalar_one_or_none()
             if msg is None:
                 logger.error("msg_in: message %s not found", msg_id)
                 return
@@ -99,7 +179,10 @@ async def msg_inbox(stop: asyncio.Event) -> None:
             if msg.is_archived:
                 return
 
-            inst: Instance = msg.instance
+            inst: Instance | None = await _get_instance(db, msg.instance_id)
+            if inst is None:
+                logger.error("msg_in: instance %s not found", msg.instance_id)
+                return
             try:
                 if msg.message_type == MessageType.call:
                     if msg.direction == MessageDirection.inc:
@@ -136,26 +219,35 @@ async def msg_inbox(stop: asyncio.Event) -> None:
                     # auto-reply
 
                     if msg.direction == MessageDirection.inc and inst.auto_reply and inst.auto_reply_text:
-                        exists = await db.scalar(select(Message.id).where(
+                        # single INSERT ... SELECT ... WHERE NOT EXISTS, no separate lookup; under READ COMMITTED
+                        # two concurrent inserts both see no recent auto row -> serialised per chat by a
+                        # transaction-scoped advisory lock (released by the commit below)
+                        await db.execute(select(func.pg_advisory_xact_lock(inst.id, func.hashtext(msg.chat_id))))
+                        recent_auto = select(Message.id).where(
                             Message.instance_id == inst.id,
                             Message.chat_id == msg.chat_id,
                             Message.is_auto == True,
-                            Message.created_at >= datetime.utcnow() - timedelta(hours=settings.AUTO_REPLY_INTERVAL),
-                        ).limit(1))
-
-                        if not exists:
-                            auto_msg = Message(
-                                instance_id=inst.id,
-                                chat_id=msg.chat_id,
-                                chat_name=msg.chat_name,
-                                direction=MessageDirection.out,
-                                is_auto=True,
-                                text=inst.auto_reply_text,
-                                status=MessageStatus.pending,
-                                message_type=MessageType.text,
+                            Message.created_at >= _utc_now() - timedelta(hours=settings.AUTO_REPLY_INTERVAL),
+                        )
+                        cols = Message.__table__.c
+                        values = {
+                            cols.instance_id: inst.id,
+                            cols.chat_id: msg.chat_id,
+                            cols.chat_name: msg.chat_name,
+                            cols.direction: MessageDirection.out,
+                            cols.is_auto: True,
+                            cols.text: inst.auto_reply_text,
+                            cols.status: MessageStatus.pending,
+                            cols.message_type: MessageType.text,
+                        }
+                        row = [literal(v, type_=c.type) for c, v in values.items()]
+                        await db.execute(
+                            insert(Message).from_select(
+                                [c.name for c in values] + [cols.created_at.name],
+                                select(*row, _utc_now()).where(~exists(recent_auto)),
                             )
-                            db.add(auto_msg)
-                            await db.commit()
+                        )
+                        await db.commit()
             except Exception as exc:
                 logger.error("msg_in: send failed → %s", exc)
                 await db.execute(
@@ -185,6 +277,7 @@ async def _send_with_files(
     """
     Selects suitable GAPI method for file type.
     Creates caption ONLY for first file
+    Multiple files go as media groups (up to 10 per call), keyboard is sent separately
     """
     first, *rest = msg.files
     chat_id = inst.telegram_channel.telegram_id
@@ -193,32 +286,81 @@ async def _send_with_files(
     if len(msg.files) == 1:
         if first.file_type is FileType.image:
             return await bot.send_photo(
-                chat_id, _tg_file(first),
+                chat_id, await _tg_file(first),
                 caption=caption, parse_mode=ParseMode.MARKDOWN,
                 reply_markup=kb,
             )
         if first.file_type is FileType.video:
             return await bot.send_video(
-                chat_id, _tg_file(first),
+                chat_id, await _tg_file(first),
                 caption=caption, parse_mode=ParseMode.MARKDOWN,
                 supports_streaming=True,
                 reply_markup=kb,
             )
         if first.file_type is FileType.audio:
             return await bot.send_audio(
-                chat_id, _tg_file(first),
+                chat_id, await _tg_file(first),
                 caption=caption, parse_mode=ParseMode.MARKDOWN,
                 reply_markup=kb,
             )
 
-    # doc or multiple files
-    cap = caption
+    # multiple files
+    done = 0
     sent_msg: TgMsg | None = None
-    for rec in msg.files:
-        sent_msg = await bot.send_document(
-            chat_id, _tg_file(rec),
+    if rest:
+        sent_msg, done = await _send_media_groups(chat_id, msg, caption, kb)
+        if done == len(msg.files):
+            return sent_msg
+
+    # doc or fallback: only files the media groups didn't deliver
+    cap = caption if done == 0 else None
+    for rec in msg.files[done:]:
+        sent = await bot.send_document(
+            chat_id, await _tg_file(rec),
             caption=cap, parse_mode=ParseMode.HTML,
             reply_markup=kb,
         )
+        if not done:     # partial groups: keep the captioned group message
+            sent_msg = sent
         cap = None
     return sent_msg
+
+
+async def _send_media_groups(
+        chat_id: int,
+        msg: Message,
+        caption: str,
+        kb: InlineKeyboardMarkup | None,
+) -> tuple[TgMsg | None, int]:
+    """
+    Returns (first message of the first group (the one with caption), number of files sent).
+    Stops at the first group Telegram rejects, the caller sends the rest one by one
+    """
+    media = [
+        InputMediaDocument(
+            media=await _tg_file(rec),
+            caption=caption if i == 0 else None,
+            parse_mode=ParseMode.HTML,
+        )
+        for i, rec in enumerate(msg.files)
+    ]
+
+    first_sent: TgMsg | None = None
+    for start in range(0, len(media), _MEDIA_GROUP_MAX):
+        try:
+            sent = await bot.send_media_group(chat_id, media[start:start + _MEDIA_GROUP_MAX])
+        except TelegramBadRequest as e:
+            logger.warning("msg_in: media group rejected (%s), sending %s remaining files one by one",
+                           e, len(media) - start)
+            return first_sent, start
+        first_sent = first_sent or sent[0]
+
+    # media groups don't accept reply_markup
+    if kb is not None:
+        await bot.send_message(
+            chat_id,
+            stringify(L.NEW_FILES, count=len(media)),
+            reply_markup=kb,
+            reply_to_message_id=first_sent.message_id,
+        )
+    return first_sent, len(media)
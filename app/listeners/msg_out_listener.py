@@ -2,14 +2,16 @@ from __future__ import annotations
 
 import asyncio
 import json
-from pathlib import Path
-from typing import Final
+import time
+from contextlib import suppress
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Final
 
+import aiofiles
 import asyncpg
+import orjson
 from aiohttp import FormData
-from sqlalchemy import select, update
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select
 
 from aiogram.types.reaction_type_emoji import ReactionTypeEmoji
 
@@ -19,13 +21,109 @@ from app.utils.config import settings
 from app.utils.db import async_session_maker
 from app.utils.messages import notify_send_error
 from shared.models import (
-    Message, MessageFile,
-    MessageStatus, FileType, Instance,
+    MessageFile,
+    MessageStatus, FileType, Instance, TelegramChannel,
 )
 
 # endpoint names
 _GREEN_ENDPOINT: Final[str] = "sendFileByUpload"
 
+_CHUNK: Final = 64 * 1024  # upload chunk
+
+# instance id -> (channel telegram_id, cached at)
+_TG_ID_TTL: Final = 60.0  # seconds
+_tg_id_cache: dict[int, tuple[int, float]] = {}
+
+# NOTIFY batching
+_QUEUE_MAX: Final = 10_000
+_BATCH_MAX: Final = 10
+_BATCH_WINDOW: Final = 0.05     # seconds
+
+# in-flight GAPI sends (sockets / FDs / rate budget)
+_SEND_SEM: Final = asyncio.Semaphore(50)
+# (instance_id, chat_id) -> [lock, users]: batches overlap, messages of one chat don't
+_chat_locks: dict[tuple[int, str], list] = {}
+
+
+@dataclass(slots=True)
+class _OutFile:
+    file_path: str
+    name: str
+    mime: str
+
+
+@dataclass(slots=True)
+class _OutMsg:
+    """Row of _FETCH_SQL (no ORM), enough for sending + notify_send_error"""
+    id: int
+    instance_id: int
+    conversation_id: int | None
+    chat_id: str
+    chat_name: str
+    text: str | None
+    tg_message_id: int | None
+    wa_message_id: str | None
+    is_archived: bool
+    from_app: bool
+    api_id: int
+    files: list[_OutFile] = field(default_factory=list)
+
+
+_FETCH_SQL: Final = """
+SELECT m.id, m.instance_id, m.conversation_id, m.chat_id, m.chat_name, m.text,
+       m.tg_message_id, m.wa_message_id, m.is_archived, m.from_app, i.api_id,
+       f.file_path, f.name AS file_name, f.mime
+FROM messages m
+JOIN instances i ON i.id = m.instance_id
+LEFT JOIN message_files f ON f.message_id = m.id
+WHERE m.id = ANY($1::int[])
+ORDER BY m.id, f.id
+"""
+
+_MARK_SQL: Final = """
+UPDATE messages SET status = $2::messagestatus, wa_message_id = COALESCE($3, wa_message_id)
+WHERE id = $1
+"""
+
+
+class _OutboxPg:
+    """
+    Prepared statements on the LISTEN connection (parsed/planned once)
+    asyncpg runs one query at a time per connection -> lock
+    """
+
+    def __init__(self, pg: asyncpg.Connection) -> None:
+        self._pg = pg
+        self._lock = asyncio.Lock()
+        self._fetch: asyncpg.prepared_stmt.PreparedStatement | None = None
+        self._mark: asyncpg.prepared_stmt.PreparedStatement | None = None
+
+    async def prepare(self) -> None:
+        self._fetch = await self._pg.prepare(_FETCH_SQL)
+        self._mark = await self._pg.prepare(_MARK_SQL)
+
+    async def fetch(self, ids: list[int]) -> dict[int, _OutMsg]:
+        async with self._lock:
+            rows = await self._fetch.fetch(ids)
+
+        found: dict[int, _OutMsg] = {}
+        for r in rows:
+            msg = found.get(r["id"])
+            if msg is None:
+                msg = found[r["id"]] = _OutMsg(
+                    id=r["id"], instance_id=r["instance_id"], conversation_id=r["conversation_id"],
+                    chat_id=r["chat_id"], chat_name=r["chat_name"], text=r["text"],
+                    tg_message_id=r["tg_message_id"], wa_message_id=r["wa_message_id"],
+                    is_archived=r["is_archived"], from_app=r["from_app"], api_id=r["api_id"],
+                )
+            if r["file_path"] is not None:
+                msg.files.append(_OutFile(r["file_path"], r["file_name"], r["mime"]))
+        return found
+
+    async def mark(self, msg_id: int, st: MessageStatus, wa_id: str | None) -> None:
+        async with self._lock:
+            await self._mark.fetch(msg_id, st.name, wa_id)
+
 
 # listener
 async def msg_outbox(stop: asyncio.Event) -> None:
@@ -41,63 +139,125 @@ async def msg_outbox(stop: asyncio.Event) -> None:
         host=settings.postgres_host,
         port=settings.postgres_port,
     )
+    out_pg = _OutboxPg(pg)
+    await out_pg.prepare()
+
+    queue: asyncio.Queue[int] = asyncio.Queue(maxsize=_QUEUE_MAX)
 
     async def handle(_, __, ___, payload: str) -> None:
-        msg_id = json.loads(payload)["msg_id"]
+        # bounded queue: a full queue makes the callback wait (backpressure), ids are never dropped -
+        # the trigger fires only once per INSERT, nothing else would pick a dropped message up
+        data = orjson.loads(payload)
+        for msg_id in data.get("msg_ids") or (data["msg_id"],):
+            await queue.put(msg_id)
 
-        async with async_session_maker() as db:
-            msg: Message | None = await db.scalar(
-                select(Message)
-                .where(Message.id == msg_id)
-                .options(selectinload(Message.files),
-                         selectinload(Message.instance).selectinload(Instance.telegram_channel))
-            )
-            if msg is None:
-                logger.error("msg_out: message %s not found", msg_id)
-                return
+    worker = asyncio.create_task(_batch_worker(out_pg, queue))
+    await pg.add_listener("msg_out", handle)
+    logger.info("LISTEN msg_out — started")
 
-            if msg.is_archived or not msg.from_app:
-                return
+    try:
+        await stop.wait()
+    finally:
+        await pg.remove_listener("msg_out", handle)
+        worker.cancel()
+        with suppress(asyncio.CancelledError):
+            await worker
+        await pg.close()
+        logger.info("LISTEN msg_out — stopped")
 
-            inst = msg.instance
-            chat_id = msg.chat_id
 
-            try:
-                async with app["client_manager"].get_client(inst.api_id) as client:
-                    if msg.files:
-                        resp = await _send_files(client, chat_id, msg)
-                    else:
-                        resp = await client.send_message(chat_id=chat_id, text=msg.text or "")
+async def _batch_worker(out_pg: _OutboxPg, queue: asyncio.Queue[int]) -> None:
+    """
+    Collects up to _BATCH_MAX ids (or waits _BATCH_WINDOW), loads them with one SELECT
+    """
+    loop = asyncio.get_running_loop()
+    batches: set[asyncio.Task] = set()
+    try:
+        while True:
+            ids = [await queue.get()]
+            deadline = loop.time() + _BATCH_WINDOW
+            while len(ids) < _BATCH_MAX:
+                try:
+                    ids.append(await asyncio.wait_for(queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+            # don't wait for the slowest chat of this batch, _SEND_SEM bounds the total
+            task = asyncio.create_task(_process_batch(out_pg, ids))
+            batches.add(task)
+            task.add_done_callback(batches.discard)
+    finally:
+        for task in batches:
+            task.cancel()
 
-                ok = await _mark_wa_id(db, msg, resp)
-                await _mark_status(db, msg, MessageStatus.sent, ok=ok)
 
-            except GreenAPIError as e:
-                await _mark_status(db, msg, MessageStatus.error_api, ok=False)
-                await notify_send_error(db, msg, f"ошибка API ({e})")
-                logger.error("API error while sending: %s", e)
+async def _process_batch(out_pg: _OutboxPg, ids: list[int]) -> None:
+    try:
+        await _process_ids(out_pg, ids)
+    except Exception:                                           # noqa: BLE001
+        logger.exception("msg_out: batch %s failed", ids)
 
-            except Exception as e:                                # noqa: BLE001
-                await _mark_status(db, msg, MessageStatus.error_int, ok=False)
-                await notify_send_error(db, msg, "внутренняя ошибка")
-                logger.exception("Internal error while sending msg")  # stack-trace
 
-    await pg.add_listener("msg_out", handle)
-    logger.info("LISTEN msg_out — started")
+async def _process_ids(out_pg: _OutboxPg, ids: list[int]) -> None:
+    found = await out_pg.fetch(ids)
+
+    # same chat -> sequentially (keeps order), different chats -> concurrently
+    chats: dict[tuple[int, str], list[_OutMsg]] = {}
+    for msg_id in ids:
+        msg = found.get(msg_id)
+        if msg is None:
+            logger.error("msg_out: message %s not found", msg_id)
+            continue
+        if msg.is_archived or not msg.from_app:
+            continue
+        chats.setdefault((msg.instance_id, msg.chat_id), []).append(msg)
 
+    await asyncio.gather(*(_deliver_chat(out_pg, key, msgs) for key, msgs in chats.items()))
+
+
+async def _deliver_chat(out_pg: _OutboxPg, key: tuple[int, str], msgs: list[_OutMsg]) -> None:
+    entry = _chat_locks.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
     try:
-        await stop.wait()
+        async with entry[0]:
+            for msg in msgs:
+                async with _SEND_SEM:
+                    await _deliver(out_pg, msg)
     finally:
-        await pg.remove_listener("msg_out", handle)
-        await pg.close()
-        logger.info("LISTEN msg_out — stopped")
+        entry[1] -= 1
+        if not entry[1]:
+            _chat_locks.pop(key, None)
+
+
+async def _deliver(out_pg: _OutboxPg, msg: _OutMsg) -> None:
+    chat_id = msg.chat_id
+    try:
+        async with app["client_manager"].get_client(msg.api_id) as client:
+            if msg.files:
+                resp = await _send_files(client, chat_id, msg)
+            else:
+                resp = await client.send_message(chat_id=chat_id, text=msg.text or "")
+
+        wa_id, ok = _resp_wa_id(msg, resp)
+        await _mark_status(out_pg, msg, MessageStatus.sent, ok=ok, wa_id=wa_id)
+
+    except GreenAPIError as e:
+        await _mark_status(out_pg, msg, MessageStatus.error_api, ok=False)
+        async with async_session_maker() as db:
+            await notify_send_error(db, msg, f"ошибка API ({e})")
+        logger.error("API error while sending: %s", e)
+
+    except Exception as e:                                # noqa: BLE001
+        await _mark_status(out_pg, msg, MessageStatus.error_int, ok=False)
+        async with async_session_maker() as db:
+            await notify_send_error(db, msg, "внутренняя ошибка")
+        logger.exception("Internal error while sending msg")  # stack-trace
 
 
 # helpers
-async def _mark_status(db, msg: Message, st: MessageStatus, *, ok: bool) -> None:
-    """Updates status + channel reaction (if sent from there)"""
-    msg.status = st
-    await db.commit()
+async def _mark_status(out_pg: _OutboxPg, msg: _OutMsg, st: MessageStatus, *,
+                       ok: bool, wa_id: str | None = None) -> None:
+    """Updates status (+ wa_message_id) in one UPDATE, then channel reaction (if sent from there)"""
+    await out_pg.mark(msg.id, st, wa_id)
 
     if msg.tg_message_id is None:
         return
@@ -105,7 +265,7 @@ async def _mark_status(db, msg: Message, st: MessageStatus, *, ok: bool) -> None
     emoji = "👍" if ok else "😡"
     try:
         await bot.set_message_reaction(
-            chat_id=msg.instance.telegram_channel.telegram_id,
+            chat_id=await _channel_tg_id(msg.instance_id),
             message_id=msg.tg_message_id,
             reaction=[ReactionTypeEmoji(emoji=emoji)],
         )
@@ -113,7 +273,23 @@ async def _mark_status(db, msg: Message, st: MessageStatus, *, ok: bool) -> None
         logger.warning("cannot set reaction: %s", e)
 
 
-async def _send_files(client, chat_id: str, msg: Message) -> None:
+async def _channel_tg_id(instance_id: int) -> int:
+    """Telegram chat id of instance's channel, cached for _TG_ID_TTL"""
+    hit = _tg_id_cache.get(instance_id)
+    if hit is not None and time.monotonic() - hit[1] < _TG_ID_TTL:
+        return hit[0]
+
+    async with async_session_maker() as db:
+        tg_id = await db.scalar(
+            select(TelegramChannel.telegram_id)
+            .join(Instance, Instance.telegram_channel_id == TelegramChannel.id)
+            .where(Instance.id == instance_id)
+        )
+    _tg_id_cache[instance_id] = (tg_id, time.monotonic())
+    return tg_id
+
+
+async def _send_files(client, chat_id: str, msg: _OutMsg) -> dict | None:
     """
     One-by-one file transfer
     First file should have caption if exists
@@ -121,12 +297,9 @@ async def _send_files(client, chat_id: str, msg: Message) -> None:
     caption = msg.text or ""
     resp = None
     for file_rec in msg.files:
-        # -> bytes for GAPI
-        data = Path(file_rec.file_path).read_bytes()
-
         resp = await client.send_file(
             chat_id=chat_id,
-            file_bytes=data,
+            file_bytes=_file_chunks(file_rec.file_path),
             filename=file_rec.name,
             mime=file_rec.mime,
             caption=caption,
@@ -136,16 +309,23 @@ async def _send_files(client, chat_id: str, msg: Message) -> None:
     return resp
 
 
-async def _mark_wa_id(db: AsyncSession, msg: Message, resp: dict) -> bool:
+async def _file_chunks(path: str) -> AsyncIterator[bytes]:
+    """Streams file from disk without blocking the loop or keeping it in RAM"""
+    async with aiofiles.open(path, "rb") as fh:
+        while chunk := await fh.read(_CHUNK):
+            yield chunk
+
+
+def _resp_wa_id(msg: _OutMsg, resp: dict) -> tuple[str | None, bool]:
+    """
+    wa_message_id to store (None -> nothing to store) + if send is ok
+    """
     wa_id = (resp or {}).get("idMessage")
     if not wa_id:
         logger.error(f"send failed: {json.dumps(resp)}")
-        return False
+        return None, False
 
     if msg.wa_message_id:
-        return msg.wa_message_id == wa_id
+        return None, msg.wa_message_id == wa_id
 
-    msg.wa_message_id = wa_id
-    db.add(msg)
-    await db.commit()
-    return True
+    return wa_id, True
@@ -14,7 +14,7 @@ from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_applicati
 from app.utils.channels import sync_channel_record
 from app.utils.commands import CMDS, SHORT_DESC, FULL_DESC
 from app.utils.config import settings
-from app.utils.db import async_session_maker
+from app.utils.db import async_session_maker, log_pool_status
 from app.green_api.manager import ClientManager
 from app.telegram_bot.handlers import register_all_handlers
 from app.routes import setup_routes
@@ -24,7 +24,7 @@ from app.utils.triggers import init_triggers_pg
 from app.listeners.msg_in_listener import msg_inbox
 from app.listeners.msg_out_listener import msg_outbox
 from app.listeners.instance_change_listener import instance_listener
-from shared.models import TelegramChannel, BotMeta
+from shared.models import TelegramChannel, BotMeta, Instance
 
 # uvloop doesn't support Windows
 # (for dev purposes)
@@ -43,6 +43,7 @@ WEBHOOK_BASE_URL = os.getenv("WEBHOOK_HOST")  # wapanel.ru
 WEBHOOK_PREFIX = f"/bot"
 WEBHOOK_PATH = f"/tg-webhooks-8008"
 LISTEN_PORT = int(os.getenv("WEBHOOK_PORT", 8008))
+_CHANNEL_SYNC_CONCURRENCY = 10  # Telegram rate limits + DB pool (each sync holds a session)
 
 # adding middleware to bot updates
 dp.update.outer_middleware(DBSessionMiddleware())
@@ -95,7 +96,6 @@ async def sync_bot_info(session: AsyncSession):
             row.is_active = False
     session.add(row)
     await session.commit()
-    await session.refresh(row)
     if row.is_active:
         logger.info(f"Bot id: {row.bot_id} {row.first_name} (@{row.username})")
     else:
@@ -140,6 +140,33 @@ async def _set_webhook():
         backoff = min(backoff * 2, 300)
 
 
+async def _sync_channels(channels) -> None:
+    """ sync_channel_record for each (id, telegram_id) row, in parallel (each run opens its own session) """
+    sem = asyncio.Semaphore(_CHANNEL_SYNC_CONCURRENCY)
+
+    async def _sync_one(chan_id: int, tg_id: int) -> None:
+        async with sem:
+            logger.info(f"  Проверяю канал {chan_id} (tg_id={tg_id}) …")
+            try:
+                await sync_channel_record(bot, tg_id)
+                logger.info(f"    → канал {tg_id} синхронизирован")
+            except Exception as e:
+                logger.error(f"    ! не удалось синхронизировать канал {tg_id}: {e}")
+
+    await asyncio.gather(*(_sync_one(c.id, c.telegram_id) for c in channels), return_exceptions=True)
+
+
+async def _background_refresh_all_channels() -> None:
+    """ channels without instances: not needed to serve traffic, synced after startup """
+    async with async_session_maker() as session:
+        channels = (await session.execute(
+            select(TelegramChannel.id, TelegramChannel.telegram_id)
+            .where(~select(Instance.id).where(Instance.telegram_channel_id == TelegramChannel.id).exists())
+        )).all()
+    await _sync_channels(channels)
+    logger.info(f"Фоновая синхронизация каналов завершена ({len(channels)})")
+
+
 # lifespan
 async def on_startup(_):
     # Telegram Bot
@@ -158,20 +185,18 @@ async def on_startup(_):
     async with async_session_maker() as session:  # type: AsyncSession
         await sync_bot_info(session)
 
-        # 1) достаём все каналы (можно фильтровать по is_active, если хотите)
+        # 1) блокируем старт только на каналах, привязанных к инстансам
         channels = (await session.execute(
-            select(TelegramChannel)
-        )).scalars().all()
+            select(TelegramChannel.id, TelegramChannel.telegram_id)
+            .join(Instance, Instance.telegram_channel_id == TelegramChannel.id)
+            .distinct()
+        )).all()
 
-        # 2) для каждого — синхронизируем
-        for chan in channels:
-            tg_id = chan.telegram_id
-            logger.info(f"  Проверяю канал {chan.id} (tg_id={tg_id}) …")
-            try:
-                await sync_channel_record(bot, tg_id, session=session)
-                logger.info(f"    → канал {tg_id} синхронизирован, is_active={chan.is_active}")
-            except Exception as e:
-                logger.error(f"    ! не удалось синхронизировать канал {tg_id}: {e}")
+    # 2) для каждого — синхронизируем (параллельно, своя сессия на канал)
+    await _sync_channels(channels)
+
+    # 3) остальные — в фоне, после старта
+    web_app["chan_refresh_task"] = asyncio.create_task(_background_refresh_all_channels())
 
     # Green API Client Manager
     web_app["client_manager"] = ClientManager(async_session_maker, logger)
@@ -179,10 +204,16 @@ async def on_startup(_):
 
     # listeners
     await start_listeners()
+
+    if settings.POOL_STATUS_INTERVAL > 0:
+        web_app["pool_status_task"] = asyncio.create_task(log_pool_status(settings.POOL_STATUS_INTERVAL))
     logger.info(f"App started")
 
 
 async def on_shutdown(_):
+    web_app["chan_refresh_task"].cancel()
+    if "pool_status_task" in web_app:
+        web_app["pool_status_task"].cancel()
     await web_app["client_manager"].close()
     await stop_listeners()
     await bot.delete_webhook()
@@ -1,32 +1,44 @@
 import asyncio
 import json, hmac, hashlib, time, os
+import orjson
 from aiohttp import web
 from aiohttp.web_exceptions import HTTPException, HTTPBadRequest
 
 from app.loader import logger, bot
 from app.green_api.manager import ClientManager
 from app.utils.history_downloader import load_history
+from app.utils.http import orjson_response
 
 
 routes = web.RouteTableDef()
 
-_COOLDOWN: dict[int, float] = {}
+_COOLDOWN: dict[int, float] = {}  # api_id -> last refresh, expired entries are pruned
 TTL = 60
 
+
+def _start_cooldown(api_id: int, now: float) -> bool:
+    """
+    False if api_id is still on cooldown, otherwise starts a new one
+    """
+    last = _COOLDOWN.get(api_id)
+    if last is not None and now - last < TTL:
+        return False
+
+    for k in [k for k, t in _COOLDOWN.items() if now - t >= TTL]:
+        del _COOLDOWN[k]
+    _COOLDOWN[api_id] = now
+    return True
+
+
 @routes.post(r"/admin/instance/{api_id:\d+}/refresh")
 async def rpc_refresh(request: web.Request) -> web.Response:
     api_id = int(request.match_info["api_id"])
-    now = time.time()
-    last = _COOLDOWN.get(api_id, 0)
-
-    if now - last < TTL:
-        return web.json_response(
+    if not _start_cooldown(api_id, time.monotonic()):
+        return orjson_response(
             {"error": "cooldown"},
             status=429,
         )
 
-    _COOLDOWN[api_id] = now
-
     im: ClientManager = request.app["client_manager"]
 
     async def _job():
@@ -36,7 +48,7 @@ async def rpc_refresh(request: web.Request) -> web.Response:
             logger.error("refresh_instance(%s) failed: %s", api_id, e)
 
     asyncio.create_task(_job())
-    return web.json_response({"status": "scheduled"}, status=202)
+    return orjson_response({"status": "scheduled"}, status=202)
 
 
 @routes.post(r"/admin/instance/{inst_id:\d+}/logout")
@@ -47,7 +59,7 @@ async def rpc_logout(request: web.Request):
     im: ClientManager = request.app["client_manager"]
 
     async with im.get_client(inst_id) as client:
-        return web.json_response({"status": "ok", "isLogout": await client.logout()})
+        return orjson_response({"status": "ok", "isLogout": await client.logout()})
 
 
 @routes.post(r"/admin/instance/{inst_id:\d+}/qr")
@@ -59,14 +71,21 @@ async def rpc_get_qr(request: web.Request):
 
     async with im.get_client(inst_id) as client:
         payload = await client.get_qr()
-        return web.json_response(payload)
+        return orjson_response(payload)
 
 
 from aiohttp import web
-from app.utils.history_downloader import load_history, history_lock
+from sqlalchemy import func, select
+from app.utils.history_downloader import load_history
+from app.utils.db import engine
 from app.loader import app, logger
 
 
+def _history_lock_key(api_id: int):
+    # api_id may not fit int4 -> (namespace, hash) pair of the two-key advisory lock
+    return func.hashtext("history"), func.hashtext(str(api_id))
+
+
 @routes.post(r"/admin/history/{api_id:\d+}")
 async def admin_history(request: web.Request) -> web.Response:
     api_id = int(request.match_info["api_id"])
@@ -78,17 +97,22 @@ async def admin_history(request: web.Request) -> web.Response:
     # json
     if not wait and request.can_read_body:
         try:
-            body = await request.json()
+            body = await request.json(loads=orjson.loads)
             wait = bool(body.get("wait_authorized", False))
         except Exception as exc:
             raise HTTPBadRequest(text=f"invalid json: {exc}") from None
 
-    # single-instance lock
-    lock = history_lock.setdefault(api_id, asyncio.Lock())
-    if lock.locked():
-        return web.json_response({"error": "already_running"}, status=409)
-
-    await lock.acquire()
+    # single-instance lock, cluster-wide: session-level advisory lock, held by this connection until unlock
+    conn = await engine.connect()
+    try:
+        locked = await conn.scalar(select(func.pg_try_advisory_lock(*_history_lock_key(api_id))))
+        await conn.commit()
+    except Exception:
+        await conn.close()
+        raise
+    if not locked:
+        await conn.close()
+        return orjson_response({"error": "already_running"}, status=409)
 
     async def _task():
         try:
@@ -96,7 +120,11 @@ async def admin_history(request: web.Request) -> web.Response:
         except Exception as e:
             logger.exception("history[%s] failed: %s", api_id, e)
         finally:
-            lock.release()
+            try:
+                await conn.execute(select(func.pg_advisory_unlock(*_history_lock_key(api_id))))
+                await conn.commit()
+            finally:
+                await conn.close()
 
     asyncio.create_task(_task())
-    return web.json_response({"status": "scheduled"}, status=201)
+    return orjson_response({"status": "scheduled"}, status=201)
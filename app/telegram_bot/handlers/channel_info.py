@@ -2,12 +2,11 @@ from aiogram import Router, F
 from aiogram.enums import ChatMemberStatus
 from aiogram.types import Message, ChatMemberUpdated
 from aiogram.enums.chat_type import ChatType
-from sqlalchemy import select
 
 from app.loader import logger
-from shared.crud.channel import get_or_create as get_or_create_channel
-from app.utils.db import async_session_maker
-from shared.models import Instance
+from shared.crud.channel import get_or_create as get_or_create_channel, upsert_channel
+from app.telegram_bot.middleware.session_middleware import current_session
+from app.utils.channels import invalidate_chat_cache
 from shared.utils import stringify
 from shared import locale as L
 
@@ -27,65 +26,49 @@ async def on_my_chat_member_update(update: ChatMemberUpdated):
 
     tg_channel_id = update.chat.id
     tg_title = update.chat.title or ""
+    invalidate_chat_cache(tg_channel_id)  # membership changed
     tg_username = getattr(update.chat, "username", None)
 
-    async with async_session_maker() as session:
-        channel_rec = await get_or_create_channel(
-            session,
-            telegram_id=tg_channel_id,
-            defaults={}
+    # bot added to channel
+    if old_status in (ChatMemberStatus.LEFT, ChatMemberStatus.KICKED) \
+            and new_status in (ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR):
+        logger.info("BOT ADDED")
+        # Attempt to generate invite link (before DB, so it's a single upsert)
+        try:
+            link = await update.bot.create_chat_invite_link(chat_id=tg_channel_id)
+            url = link.invite_link
+        except Exception:
+            # fallback
+            if tg_username:
+                url = f"https://t.me/{tg_username}"
+            else:
+                url = f"https://t.me/c/{str(tg_channel_id)}"
+
+        # upsert channel + its instances' api_ids in one query
+        api_ids = await upsert_channel(current_session.get(), tg_channel_id,
+                                       name=tg_title, url=url, is_active=True)
+
+        text = stringify(L.ON_JOIN_DEFAULT, channel_id=tg_channel_id)
+        if api_ids:
+            ids_list = ", ".join(str(i) for i in api_ids)
+            text = stringify(L.ON_JOIN_INSTANCE, instances=ids_list)
+
+        await update.bot.send_message(
+            chat_id=tg_channel_id,
+            text=text,
+            parse_mode="Markdown",
         )
+        return
+
+    elif old_status in (ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR) \
+            and new_status in (ChatMemberStatus.LEFT, ChatMemberStatus.KICKED):
+        logger.info("BOT REMOVED")
+        await upsert_channel(current_session.get(), tg_channel_id, name=None, url=None, is_active=False)
+        print(f"Бот удалён из канала: {tg_title or tg_channel_id}")
+        return
 
-        # bot added to channel
-        if old_status in (ChatMemberStatus.LEFT, ChatMemberStatus.KICKED) \
-                and new_status in (ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR):
-            logger.info("BOT ADDED")
-            # updates the name
-            channel_rec.name = tg_title
-
-            # Attempt to generate invite link
-            try:
-                link = await update.bot.create_chat_invite_link(chat_id=tg_channel_id)
-                channel_rec.url = link.invite_link
-            except Exception:
-                # fallback
-                if tg_username:
-                    channel_rec.url = f"https://t.me/{tg_username}"
-                else:
-                    channel_rec.url = f"https://t.me/c/{str(tg_channel_id)}"
-
-            channel_rec.is_active = True
-
-            session.add(channel_rec)
-            await session.commit()
-
-            res = await session.execute(
-                select(Instance.api_id).where(Instance.telegram_channel_id == channel_rec.id)
-            )
-            api_ids = [row[0] for row in res.all()]
-
-            text = stringify(L.ON_JOIN_DEFAULT, channel_id=tg_channel_id)
-            if api_ids:
-                ids_list = ", ".join(str(i) for i in api_ids)
-                text = stringify(L.ON_JOIN_INSTANCE, instances=ids_list)
-
-            await update.bot.send_message(
-                chat_id=tg_channel_id,
-                text=text,
-                parse_mode="Markdown",
-            )
-            return
-
-        elif old_status in (ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR) \
-                and new_status in (ChatMemberStatus.LEFT, ChatMemberStatus.KICKED):
-            logger.info("BOT REMOVED")
-            channel_rec.name = None
-            channel_rec.url = None
-            channel_rec.is_active = False
-            session.add(channel_rec)
-            await session.commit()
-            print(f"Бот удалён из канала: {tg_title or tg_channel_id}")
-            return
+    # other transitions: just make sure the record exists
+    await get_or_create_channel(current_session.get(), telegram_id=tg_channel_id, defaults={})
 
 
 @router.channel_post(F.new_chat_title)
@@ -97,19 +80,20 @@ async def on_channel_title_change(msg: Message):
 
     tg_channel_id = msg.chat.id
     new_title = msg.new_chat_title
+    invalidate_chat_cache(tg_channel_id)
 
-    async with async_session_maker() as session:
-        channel_rec = await get_or_create_channel(
-            session,
-            telegram_id=tg_channel_id,
-            defaults={}
-        )
-        channel_rec.name = new_title
+    session = current_session.get()
+    channel_rec = await get_or_create_channel(
+        session,
+        telegram_id=tg_channel_id,
+        defaults={}
+    )
+    channel_rec.name = new_title
 
-        if msg.chat.username:
-            channel_rec.url = f"https://t.me/{msg.chat.username}"
+    if msg.chat.username:
+        channel_rec.url = f"https://t.me/{msg.chat.username}"
 
-        session.add(channel_rec)
-        await session.commit()
+    session.add(channel_rec)
+    await session.commit()
 
-        logger.info(f"new name: {channel_rec.name} | {channel_rec.url}")
+    logger.info(f"new name: {channel_rec.name} | {channel_rec.url}")
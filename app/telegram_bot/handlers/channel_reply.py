@@ -1,20 +1,23 @@
 from __future__ import annotations
 
-import asyncio, mimetypes, tempfile
+import asyncio, mimetypes
 import os
+import time
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from typing import Final
+from uuid import uuid4
 
+import aiofiles.os
 from aiogram import F, Router
 from aiogram.types import (Message, File, Sticker, Voice)
 from aiogram.types.reaction_type_emoji import ReactionTypeEmoji
 
 from app.green_api.green_msg import _public_url
 from app.loader import bot, logger
-from app.utils.db import async_session_maker
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from app.telegram_bot.middleware.session_middleware import current_session
+from sqlalchemy import insert, select
 
 from shared.crud.conversations import get_or_create_conversation
 from shared.models import (
@@ -27,8 +30,13 @@ router = Router(name="relay_to_whatsapp")
 
 MEDIA_ROOT: Final = Path(os.getenv("MEDIA_ROOT", "/app/media"))
 
+# bot.get_file results (bursty channels repost the same photo/sticker)
+_GET_FILE_TTL: Final = 30.0  # seconds
+_get_file_cache: dict[str, tuple[File, float]] = {}
+
 
 # helpers
+@lru_cache(maxsize=64)
 def _detect_class(mime: str) -> FileType:
     if mime.startswith("image/"):
         return FileType.image
@@ -39,43 +47,58 @@ def _detect_class(mime: str) -> FileType:
     return FileType.other
 
 
-TMP_DIR = Path(tempfile.gettempdir()) / "tg_uploads"
-TMP_DIR.mkdir(exist_ok=True)
+@lru_cache(maxsize=256)
+def _guess_mime(suffix: str) -> str | None:
+    """ mimetypes.guess_type keyed by (lowercase) suffix only """
+    return mimetypes.guess_type(f"file{suffix}")[0]
 
 
-def _build_media_path(fname: str) -> Path:
+async def _build_media_path(fname: str) -> Path:
     """
-    Generates path /app/media/2025/06/<fname> or /app/media/2025/06/<fname>_N if file already exists
+    Generates path /app/media/2025/06/<fname> or /app/media/2025/06/<fname>_<random> if file already exists
     """
+    # media/<yyyy>/<mm>; made on every save (cheap), the directory may be removed by media cleanup
     dst_dir = MEDIA_ROOT / datetime.utcnow().strftime("%Y/%m")
-    dst_dir.mkdir(parents=True, exist_ok=True)
+    await aiofiles.os.makedirs(dst_dir, exist_ok=True)
 
-    stem, suffix = Path(fname).stem, Path(fname).suffix
     candidate = dst_dir / fname
-    n = 1
-    while candidate.exists():
-        candidate = dst_dir / f"{stem}_{n}{suffix}"
-        n += 1
+    if await aiofiles.os.path.exists(candidate):  # one probe instead of _1, _2, ... loop
+        p = Path(fname)
+        candidate = dst_dir / f"{p.stem}_{uuid4().hex[:8]}{p.suffix}"
     return candidate
 
 
-async def _download_tg_file(file_id: str) -> tuple[str, str, str]:
+async def _get_file(file_id: str) -> File:
+    """ bot.get_file, cached for _GET_FILE_TTL """
+    now = time.monotonic()
+    hit = _get_file_cache.get(file_id)
+    if hit is not None and now - hit[1] < _GET_FILE_TTL:
+        return hit[0]
+
+    tg_file: File = await bot.get_file(file_id)
+    # drop expired entries so the dict stays small
+    for k in [k for k, (_, ts) in _get_file_cache.items() if now - ts >= _GET_FILE_TTL]:
+        del _get_file_cache[k]
+    _get_file_cache[file_id] = (tg_file, now)
+    return tg_file
+
+
+async def _download_tg_file(file_id: str, known_mime: str | None = None) -> tuple[str, str, str]:
     """
     downloads TG file and saves into media/YY/MM,
     returns (absolute_path, stored_name, mime)
+    known_mime: mime_type from Telegram (Video/Audio/Document/...), skips guessing by suffix
     """
-    tg_file: File = await bot.get_file(file_id)
+    tg_file = await _get_file(file_id)
 
     # orig name if exists
     orig_name = Path(tg_file.file_path).name or f"{file_id}"
-    local_path = _build_media_path(orig_name)
-
-    # prepare dirs
-    local_path.parent.mkdir(parents=True, exist_ok=True)
+    local_path = await _build_media_path(orig_name)
 
+    # aiogram writes to the path with aiofiles -> doesn't block the loop
     await bot.download_file(tg_file.file_path, destination=local_path)
 
-    mime, _ = mimetypes.guess_type(local_path.name)
+    mime = known_mime or _guess_mime(local_path.suffix.lower())
     return str(local_path), local_path.name, mime or "application/octet-stream"
 
 
@@ -97,90 +120,94 @@ async def relay_channel_reply(msg: Message) -> None:
     Reply -> Message(direction=out, status=pending), quick response
     """
 
-    # find Message in DB, reply was sent to
-    async with (async_session_maker() as db):
-        parent: MsgDB | None = await db.scalar(
-            select(MsgDB)
-            .where(MsgDB.tg_message_id == msg.reply_to_message.message_id)
-            .options(selectinload(MsgDB.instance), selectinload(MsgDB.conversation))
+    db = current_session.get()
+
+    # find Message in DB, reply was sent to (plain columns, no ORM objects)
+    parent = (await db.execute(
+        select(MsgDB.id, MsgDB.direction, MsgDB.instance_id, MsgDB.conversation_id, MsgDB.chat_id)
+        .where(MsgDB.tg_message_id == msg.reply_to_message.message_id)
+    )).first()
+    # end read transaction -> connection goes back to the pool during download
+    await db.commit()
+    if not parent or parent.direction is not MessageDirection.inc:
+        return
+
+    try:
+        out_msg = dict(
+            instance_id=parent.instance_id,
+            conversation_id=parent.conversation_id,
+            chat_id=parent.chat_id,
+            direction=MessageDirection.out,
+            tg_message_id=msg.message_id,
+            chat_name=parent.chat_id.split("@")[0],
+            from_app=True,
+            status=MessageStatus.pending,
+            message_type=MessageType.text,
+            text=msg.text or msg.caption or "",
+            quote_id=parent.id,
         )
-        if not parent or parent.direction is not MessageDirection.inc:
-            return
+        file_row: dict | None = None
+
+        tg_file = None
+        # attachments
+        if msg.photo or msg.video or msg.audio or msg.voice or msg.document:
+            # correct File type
+            if msg.photo:
+                tg_file = max(msg.photo, key=lambda p: p.file_size or 0)
+            elif msg.video:
+                tg_file = msg.video
+            elif msg.audio:
+                tg_file = msg.audio
+            elif msg.voice:
+                tg_file = msg.voice
+                fcls = FileType.audio
+            else:
+                tg_file = msg.document
+        elif msg.sticker:
+            st: Sticker = msg.sticker
+            if st.is_animated or st.is_video:
+                await _react(msg, False)
+                return
+            tg_file = st
 
-        try:
-            inst = parent.instance
-            conv = parent.conversation
-
-            out_msg = MsgDB(
-                instance_id=inst.id,
-                conversation_id=conv.id,
-                chat_id=parent.chat_id,
-                direction=MessageDirection.out,
-                tg_message_id=msg.message_id,
-                chat_name=parent.chat_id.split("@")[0],
-                from_app=True,
-                status=MessageStatus.pending,
-                message_type=MessageType.text,
-                text=msg.text or msg.caption or "",
-                quote_id=parent.id,
+        if tg_file:
+            local_path, fname, mime = await _download_tg_file(
+                tg_file.file_id, getattr(tg_file, "mime_type", None)
             )
 
-            tg_file = None
-            # attachments
-            if msg.photo or msg.video or msg.audio or msg.voice or msg.document:
-                # correct File type
-                if msg.photo:
-                    tg_file = max(msg.photo, key=lambda p: p.file_size or 0)
-                elif msg.video:
-                    tg_file = msg.video
-                elif msg.audio:
-                    tg_file = msg.audio
-                elif msg.voice:
-                    tg_file = msg.voice
-                    fcls = FileType.audio
-                else:
-                    tg_file = msg.document
-            elif msg.sticker:
-                st: Sticker = msg.sticker
-                if st.is_animated or st.is_video:
-                    await _react(msg, False)
-                    return
-                tg_file = st
-
-            if tg_file:
-                local_path, fname, mime = await _download_tg_file(tg_file.file_id)
-
-                if isinstance(tg_file, Sticker) and mime == "application/octet-stream":
-                    mime = "image/webp"
-
-                if isinstance(tg_file, Voice):
-                    fname = f"{tg_file.file_id}.ogg"
-
-                fclass = _detect_class(mime)
-
-                kind_map = {
-                    FileType.image: MessageType.file_image,
-                    FileType.video: MessageType.file_video,
-                    FileType.audio: MessageType.file_audio,
-                    FileType.other: MessageType.file_doc,
-                }
-                out_msg.message_type = kind_map[fclass]
-
-                out_msg.files.append(
-                    MessageFile(
-                        file_type=fclass,
-                        name=fname,
-                        mime=mime,
-                        file_path=local_path,
-                        file_url=_public_url(local_path),
-                    )
-                )
-            try:
-                db.add(out_msg)
-                await db.commit()
-            except Exception as e:
-                logger.error(f"Something went wrong while saving TG message: {e}")
-                await _react(msg, False)
+            if isinstance(tg_file, Sticker) and mime == "application/octet-stream":
+                mime = "image/webp"
+
+            if isinstance(tg_file, Voice):
+                fname = f"{tg_file.file_id}.ogg"
+
+            fclass = _detect_class(mime)
+
+            kind_map = {
+                FileType.image: MessageType.file_image,
+                FileType.video: MessageType.file_video,
+                FileType.audio: MessageType.file_audio,
+                FileType.other: MessageType.file_doc,
+            }
+            out_msg["message_type"] = kind_map[fclass]
+
+            file_row = dict(
+                file_type=fclass,
+                name=fname,
+                mime=mime,
+                file_path=local_path,
+                file_url=_public_url(local_path),
+            )
+        try:
+            # INSERT ... RETURNING id + file row, one transaction (NOTIFY msg_out fires on commit)
+            out_id = await db.scalar(insert(MsgDB).values(**out_msg).returning(MsgDB.id))
+            if file_row is not None:
+                await db.execute(insert(MessageFile).values(message_id=out_id, **file_row))
+            await db.commit()
         except Exception as e:
+            await db.rollback()
             logger.error(f"Something went wrong while saving TG message: {e}")
             await _react(msg, False)
+    except Exception as e:
+        logger.error(f"Something went wrong while saving TG message: {e}")
+        await _react(msg, False)
@@ -1,5 +1,4 @@
 from aiogram import types, Router
-from aiogram.filters import StateFilter, Command
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from shared.models import User
@@ -8,13 +7,17 @@ from shared.utils import stringify
 
 router = Router()
 
-
-@router.message(Command("id", "start"))
-async def generic_handler(message: types.Message, session: AsyncSession):
-    await message.reply(stringify(L.ID_RESPONSE, tg_id=message.from_user.id), parse_mode="Markdown")
+_ID_COMMANDS = frozenset({"/id", "/start"})
 
 
 @router.message()
 async def generic_handler(message: types.Message, session: AsyncSession):
+    """
+    /id, /start -> user's Telegram id, anything else -> default response
+    """
+    # "/start", "/start@bot_name", "/start payload"
+    cmd = (message.text or "").split(maxsplit=1)[0:1]
+    if cmd and cmd[0].split("@", 1)[0] in _ID_COMMANDS:
+        await message.reply(stringify(L.ID_RESPONSE, tg_id=message.from_user.id), parse_mode="Markdown")
+        return
     await message.reply(L.DEFAULT_RESPONSE, parse_mode="Markdown")
-
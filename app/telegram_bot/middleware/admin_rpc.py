@@ -1,14 +1,19 @@
-import os
+import hmac
+from typing import Final
+
 from aiohttp import web
 
 from app.utils.config import settings
 
-PREFIX = ("/admin/",)
+PREFIX: Final = "/admin/"
+_ADMIN_TOKEN: Final = settings.ADMIN_RPC_TOKEN.encode()
 
 
 @web.middleware
 async def check_admin_token(request: web.Request, handler):
     if request.path.startswith(PREFIX):
-        if request.headers.get("X-Admin-Token") != settings.ADMIN_RPC_TOKEN:
+        # bytes: compare_digest rejects non-ASCII str
+        token = request.headers.get("X-Admin-Token", "").encode()
+        if not hmac.compare_digest(token, _ADMIN_TOKEN):
             raise web.HTTPUnauthorized(text="invalid or missing token")
-    return await handler(request)
\ No newline at end of file
+    return await handler(request)
@@ -1,19 +1,33 @@
+from contextvars import ContextVar
+
 from aiogram import BaseMiddleware
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.utils.db import async_session_maker
 
+# session of the update being handled; for handlers that don't take `session` argument
+current_session: ContextVar[AsyncSession] = ContextVar("current_session")
+
 
 class DBSessionMiddleware(BaseMiddleware):
     """
-    Opens async connection to database, passes it as session argument to handler and commits changes on exit.
+    Opens async connection to database, passes it as session argument to handler (and current_session contextvar)
+    and commits changes on exit. One session (one pool checkout) per update.
+    AsyncSession checks out a connection only on the first query, so updates that don't touch the DB
+    cost no checkout; commit/rollback are skipped for them as well.
     """
     async def __call__(self, handler, event, data):
         async with async_session_maker() as session:
             data["session"] = session
+            token = current_session.set(session)
             try:
                 result = await handler(event, data)
-                await session.commit()
+                if session.in_transaction():
+                    await session.commit()
                 return result
             except Exception:
-                await session.rollback()
-                raise
\ No newline at end of file
+                if session.in_transaction():
+                    await session.rollback()
+                raise
+            finally:
+                current_session.reset(token)
@@ -1,5 +1,11 @@
+import asyncio
+import time
+from typing import Final
+
 from aiogram import Bot
 from aiogram.enums.chat_member_status import ChatMemberStatus
+from aiogram.exceptions import TelegramUnauthorizedError
+from aiogram.types import ChatFullInfo, ChatMember, User
 from aiogram.enums.chat_type import ChatType
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
@@ -8,22 +14,75 @@ from shared.crud.channel import get_or_create as get_or_create_channel
 from shared.models import TelegramChannel
 from app.utils.db import async_session_maker
 
+_ME: User | None = None                     # bot identity, doesn't change while token is valid
+_inflight: dict[int, asyncio.Task] = {}     # telegram_channel_id -> running sync
+
+# get_chat_member + get_chat results per channel (bulk reconciliation hits the same channels)
+_CHAT_TTL: Final = 60.0  # seconds
+_chat_cache: dict[int, tuple[ChatMember, ChatFullInfo, float]] = {}
+
+
+async def _get_me(bot: Bot) -> User:
+    global _ME
+    if _ME is None:
+        _ME = await bot.get_me()
+    return _ME
+
+
+async def _get_chat_info(bot: Bot, telegram_channel_id: int) -> tuple[ChatMember, ChatFullInfo]:
+    """ (bot membership, chat info), cached for _CHAT_TTL """
+    now = time.monotonic()
+    hit = _chat_cache.get(telegram_channel_id)
+    if hit is not None and now - hit[2] < _CHAT_TTL:
+        return hit[0], hit[1]
+
+    member = await bot.get_chat_member(chat_id=telegram_channel_id, user_id=(await _get_me(bot)).id)
+    chat = await bot.get_chat(chat_id=telegram_channel_id)
+    for k in [k for k, v in _chat_cache.items() if now - v[2] >= _CHAT_TTL]:
+        del _chat_cache[k]
+    _chat_cache[telegram_channel_id] = (member, chat, now)
+    return member, chat
+
+
+def invalidate_chat_cache(telegram_channel_id: int) -> None:
+    """ next sync_channel_record asks Telegram again (explicit refresh) """
+    _chat_cache.pop(telegram_channel_id, None)
+
+
+async def sync_channel_record(bot: Bot, telegram_channel_id: int) -> None:
+    """
+    Syncs TelegramChannel with Telegram; concurrent calls for the same channel share one run.
+    The shared run owns its session: a cancelled caller can't close it under the others
+    """
+    task = _inflight.get(telegram_channel_id)
+    if task is None:
+        task = asyncio.create_task(_run_sync(bot, telegram_channel_id))
+        _inflight[telegram_channel_id] = task
+        task.add_done_callback(lambda _: _inflight.pop(telegram_channel_id, None))
+    await asyncio.shield(task)
+
+
+async def _run_sync(bot: Bot, telegram_channel_id: int) -> None:
+    async with async_session_maker() as session:
+        await _sync_channel_record(bot, telegram_channel_id, session=session)
+
 
-async def sync_channel_record(
+async def _sync_channel_record(
     bot: Bot,
     telegram_channel_id: int,
     *,
     session: AsyncSession
 ) -> None:
+    global _ME
     # Ger or create channel obj
     chan = await get_or_create_channel(session, telegram_id=telegram_channel_id, defaults={})
 
     try:
-        # bot status in chat
-        member = await bot.get_chat_member(chat_id=telegram_channel_id, user_id=(await bot.get_me()).id)
-        # chat info
-        chat = await bot.get_chat(chat_id=telegram_channel_id)
-    except Exception:
+        # bot status in chat + chat info
+        member, chat = await _get_chat_info(bot, telegram_channel_id)
+    except Exception as e:
+        if isinstance(e, TelegramUnauthorizedError):
+            _ME = None
         # unavailable
         chan.is_active = False
         chan.name = None
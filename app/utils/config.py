@@ -1,14 +1,26 @@
+import os
+from functools import cached_property
+
+from pydantic import Field, ValidationInfo, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+def _default_pool_size() -> int:
+    """ 5 connections per web worker, 5..20 """
+    return max(5, min(20, int(os.getenv("WEB_CONCURRENCY", "1")) * 5))
+
+
 class Settings(BaseSettings):
     postgres_user: str
     postgres_password: str
     postgres_host: str = "green_db"
     postgres_port: int = 5432
     postgres_db: str
-    pool_size: int = 50
-    max_overflow: int = 5
+    pool_size: int = Field(default_factory=_default_pool_size)
+    max_overflow: int | None = Field(None, validate_default=True)  # = pool_size if not set (never more)
+    pool_pre_ping: bool = True
+    pool_recycle: int = 1800            # seconds
+    POOL_STATUS_INTERVAL: int = 30      # seconds, 0 = don't log pool status
 
     bot_token: str
 
@@ -24,9 +36,16 @@ class Settings(BaseSettings):
 
     HISTORY_WAIT_AUTHORIZED: int = 60   # minutes
 
-    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore", frozen=True)
+
+    @field_validator("max_overflow")
+    @classmethod
+    def _overflow(cls, v: int | None, info: ValidationInfo) -> int:
+        # frozen model -> clamp during validation (pool_size is validated first)
+        pool_size = info.data["pool_size"]
+        return pool_size if v is None or v > pool_size else v
 
-    @property
+    @cached_property
     def database_url(self) -> str:  # → postgresql+asyncpg://user:pw@host/db
         return (
             f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}"
@@ -1,8 +1,22 @@
+import asyncio
+
 from app.utils.config import settings
 from shared.database import make_async_engine
+from shared.logger import get_logger
+
+logger = get_logger(__name__)
 
 engine, async_session_maker = make_async_engine(
     settings.database_url,
     pool_size=settings.pool_size,
     max_overflow=settings.max_overflow,
-)
\ No newline at end of file
+    pool_pre_ping=settings.pool_pre_ping,
+    pool_recycle=settings.pool_recycle,
+)
+
+
+async def log_pool_status(interval: float) -> None:
+    """ Logs engine.pool.status() every <interval> seconds, to tune pool_size / max_overflow """
+    while True:
+        await asyncio.sleep(interval)
+        logger.info("DB pool: %s", engine.pool.status())
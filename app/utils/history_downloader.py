@@ -1,22 +1,50 @@
 from __future__ import annotations
-import asyncio, math, json, os
+import asyncio, enum, math, json, os, time
 from datetime import datetime
 from typing import Any
 
 from aiogram import Bot
-from sqlalchemy import select
-from typing import Any, TypedDict, Literal
+from aiogram.exceptions import TelegramRetryAfter
+from sqlalchemy import Column, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Callable, TypedDict, Literal
 
 from sqlalchemy.orm import selectinload
 
+from app.green_api.client import GreenAPIClient
+from app.green_api.exceptions import GreenAPIThrottleError
 from app.green_api.green_msg import payload_to_msg
 from app.green_api.manager import ClientManager
+from app.green_api.webhook import resolve_instance
+from app.utils.config import settings
 from app.utils.db import async_session_maker
 from app.loader import logger, bot
-from shared.models import Instance, Message
+from shared.crud.conversations import get_or_create_conversation
+from shared.models import Instance, Message, MessageFile
 
-history_lock: dict[int, asyncio.Lock] = {}
 _DOWNLOAD_LIMIT = 10000     # 10K is the maximum number of messages WhatsApp gives to GreenAPI according to docs
+_PAGE = 500                 # history entries per existence check + COPY + commit
+_CHAT_CONCURRENCY = 5       # chats imported in parallel, at most half of the pool (see load_history)
+_THROTTLE_RETRIES = 4       # getChatHistory attempts on 429, backoff 2, 4, 8 s
+_TG_SEND_INTERVAL = 1.0     # seconds between notifications to one channel
+_TG_SEND_BUFFER = 20        # queued notifications per channel, newer ones are dropped above that
+_TG_SEND_RETRIES = 3        # attempts on RetryAfter
+
+# COPY fast path for archived imports
+_MSG_COLS: list[Column] = [c for c in Message.__table__.c if c.key != "id" and c.computed is None]
+_MSG_COL_NAMES = [c.name for c in _MSG_COLS]
+_FILE_COLS: list[Column] = [c for c in MessageFile.__table__.c if c.key not in ("id", "message_id")]
+_FILE_COL_NAMES = [c.name for c in _FILE_COLS]
+_TMP_TABLE = "_history_msgs"
+_TMP_CREATE_SQL = (  # column types only, no constraints/defaults; lives as long as the pooled connection
+    f"CREATE TEMP TABLE IF NOT EXISTS {_TMP_TABLE} AS "
+    f"SELECT {', '.join(_MSG_COL_NAMES)} FROM {Message.__tablename__} WITH NO DATA"
+)
+_TMP_INSERT_SQL = (
+    f"INSERT INTO {Message.__tablename__} ({', '.join(_MSG_COL_NAMES)}) "
+    f"SELECT {', '.join(_MSG_COL_NAMES)} FROM {_TMP_TABLE} "
+    f"ON CONFLICT (instance_id, wa_message_id) DO NOTHING RETURNING wa_message_id, id"
+)
 
 
 class SenderData(TypedDict, total=False):
@@ -76,65 +104,88 @@ def _file_section(entry: dict[str, Any]) -> dict[str, Any]:
 def _split_message(msg: str, *, with_photo: bool) -> list[str]:
     """Split the text into parts considering Telegram limits."""
     parts = []
-    while msg:
-        # Determine the maximum message length based on
-        # with_photo and whether it's the first iteration
-        # (photo is sent only with the first message).
-        if parts:
-            max_msg_length = 4096
-        elif with_photo:
-            max_msg_length = 1024
-        else:
-            max_msg_length = 4096
-
-        if len(msg) <= max_msg_length:
-            # The message length fits within the maximum allowed.
-            parts.append(msg)
+    start, n = 0, len(msg)
+    # photo is sent only with the first message
+    first_limit = 1024 if with_photo else 4096
+    while start < n:
+        end = start + (4096 if parts else first_limit)
+
+        if end >= n:
+            # The rest fits within the maximum allowed.
+            parts.append(msg[start:])
             break
 
-        # Cut a part of the message with the maximum length from msg
-        # and find a position for a break by a newline character.
-        part = msg[:max_msg_length]
-        first_ln = part.rfind("\n")
-
-        if first_ln != -1:
-            # Newline character found.
-            # Split the message by it, excluding the character itself.
-            new_part = part[:first_ln]
-            parts.append(new_part)
+        # Break by a newline character, else by a space (searching the original string,
+        # no intermediate slices), excluding the character itself.
+        brk = msg.rfind("\n", start, end)
+        if brk == -1:
+            brk = msg.rfind(" ", start, end)
 
-            # Trim msg to the length of the new part
-            # and remove the newline character.
-            msg = msg[first_ln + 1:]
+        if brk != -1:
+            parts.append(msg[start:brk])
+            start = brk + 1
             continue
 
-        # No newline character found in the message part.
-        # Try to find at least a space for a break.
-        first_space = part.rfind(" ")
+        # No suitable place for a break found, hard cut.
+        parts.append(msg[start:end])
+        start = end
 
-        if first_space != -1:
-            # Space character found.
-            # Split the message by it, excluding the space itself.
-            new_part = part[:first_space]
-            parts.append(new_part)
+    return parts
 
-            # Trimming msg to the length of the new part
-            # and removing the space.
-            msg = msg[first_space + 1:]
-            continue
 
-        # No suitable place for a break found in the message part.
-        # Add the current part and trim the message to its length.
-        parts.append(part)
-        msg = msg[max_msg_length:]
+class _TgSender:
+    """
+    Fire-and-forget Telegram sender: one bounded queue + worker per chat,
+    keeps order, sends at most one message per _TG_SEND_INTERVAL, waits out RetryAfter
+    """
 
-    return parts
+    def __init__(self) -> None:
+        self._queues: dict[int, asyncio.Queue[str]] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+
+    def send(self, bot_inst: Bot, chat_id: int, text: str) -> None:
+        q = self._queues.get(chat_id)
+        if q is None:
+            q = self._queues[chat_id] = asyncio.Queue(_TG_SEND_BUFFER)
+        try:
+            q.put_nowait(text)
+        except asyncio.QueueFull:
+            logger.warning("TG-notify buffer for %s is full, message dropped", chat_id)
+            return
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._run(bot_inst, chat_id, q))
+
+    async def _run(self, bot_inst: Bot, chat_id: int, q: asyncio.Queue[str]) -> None:
+        last = 0.0
+        try:
+            while not q.empty():
+                text = q.get_nowait()
+                delay = last + _TG_SEND_INTERVAL - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                for _ in range(_TG_SEND_RETRIES):
+                    try:
+                        await bot_inst.send_message(chat_id, text)
+                        break
+                    except TelegramRetryAfter as e:
+                        await asyncio.sleep(e.retry_after)
+                    except Exception as e:
+                        logger.warning("TG-notify failed: %s", e)
+                        break
+                last = time.monotonic()
+        finally:
+            # queue is empty here (no await since the check), next send() starts a new worker
+            self._workers.pop(chat_id, None)
+            self._queues.pop(chat_id, None)
+
+
+_sender = _TgSender()
 
 
 async def _notify(app, api_id: int, text: str) -> None:
     """
     Attempt to send the message in Telegram channel assigned to instance,
-    best-effort
+    best-effort, doesn't wait for delivery
     """
     try:
         bot_inst: Bot | None = bot
@@ -148,91 +199,241 @@ async def _notify(app, api_id: int, text: str) -> None:
                 .where(Instance.api_id == api_id)
             )
 
-            tg = inst and inst.telegram_channel
-            if not (tg and tg.is_active):
-                return
+        tg = inst and inst.telegram_channel
+        if not (tg and tg.is_active):
+            return
 
-            parts = _split_message(text, with_photo=False)
-            for part in parts:
-                await bot_inst.send_message(tg.telegram_id, part)
+        for part in _split_message(text, with_photo=False):
+            _sender.send(bot_inst, tg.telegram_id, part)
     except Exception as e:
         logger.warning("TG-notify failed: %s", e)
 
 
+# typeMessage -> fills messageData from history entry
+def _h_text(entry: dict[str, Any], mdata: dict[str, Any]) -> None:
+    mdata["textMessageData"] = {"textMessage": entry["textMessage"]}
+
+
+def _h_ext(entry: dict[str, Any], mdata: dict[str, Any]) -> None:
+    txt = entry.get("textMessage") or entry["extendedTextMessage"]["text"]
+    mdata["extendedTextMessageData"] = {"text": txt}
+
+
+def _h_reaction(entry: dict[str, Any], mdata: dict[str, Any]) -> None:
+    # extendedTextMessageData
+    mdata["extendedTextMessageData"] = entry["extendedTextMessageData"]
+    if "quotedMessage" in entry:
+        mdata["quotedMessage"] = entry["quotedMessage"]
+
+
+def _h_quoted(entry: dict[str, Any], mdata: dict[str, Any]) -> None:
+    mdata["extendedTextMessageData"] = entry["extendedTextMessage"]
+    mdata["quotedMessage"] = entry["quotedMessage"]
+
+
+def _h_file(entry: dict[str, Any], mdata: dict[str, Any]) -> None:
+    mdata["fileMessageData"] = _file_section(entry)
+
+
+def _h_location(entry: dict[str, Any], mdata: dict[str, Any]) -> None:
+    mdata["locationMessageData"] = entry["location"]
+
+
+def _h_contact(entry: dict[str, Any], mdata: dict[str, Any]) -> None:
+    mdata["contactMessageData"] = entry["contact"]
+
+
+def _h_contacts(entry: dict[str, Any], mdata: dict[str, Any]) -> None:
+    mdata["messageData"] = {"contacts": entry["contacts"]}
+
+
+def _h_poll(entry: dict[str, Any], mdata: dict[str, Any]) -> None:
+    mdata["pollMessageData"] = entry["pollMessageData"]
+
+
+def _h_buttons(entry: dict[str, Any], mdata: dict[str, Any]) -> None:
+    mdata["interactiveButtons"] = entry["interactiveButtons"]
+
+
+_HANDLERS: dict[str, Callable[[dict[str, Any], dict[str, Any]], None]] = {
+    "textMessage": _h_text,
+    "extendedTextMessage": _h_ext,
+    "reactionMessage": _h_reaction,
+    "quotedMessage": _h_quoted,
+    "locationMessage": _h_location,
+    "contactMessage": _h_contact,
+    "contactsArrayMessage": _h_contacts,
+    "pollMessage": _h_poll,
+    "pollUpdateMessage": _h_poll,
+    "interactiveButtons": _h_buttons,
+    **dict.fromkeys(_FILE_MTYPES, _h_file),
+}
+
+# (incoming, sendByApi) -> typeWebhook
+_TYPE_WEBHOOK: dict[tuple[bool, bool], str] = {
+    (True, False): _INCOMING,
+    (True, True): _INCOMING,
+    (False, True): _OUTGOING_BY_API,
+    (False, False): _OUTGOING_BY_PHONE,
+}
+
+
 def history_entry_to_payload(entry: dict[str, Any], api_id: int) -> PayloadDict:
     """
     getChatHistory -> dict
     """
-    # typeWebhook
-    if entry["type"] == "incoming":
-        type_webhook = _INCOMING
-    else:  # outgoing
-        type_webhook = (
-            _OUTGOING_BY_API if entry.get("sendByApi") else _OUTGOING_BY_PHONE
-        )
+    mtype: str = entry["typeMessage"]
+    mdata: dict[str, Any] = {"typeMessage": mtype}
 
     payload: PayloadDict = {
-        "typeWebhook": type_webhook,
+        "typeWebhook": _TYPE_WEBHOOK[entry["type"] == "incoming", bool(entry.get("sendByApi"))],
         "idMessage": entry["idMessage"],
         "timestamp": entry["timestamp"],
         "instanceData": {"idInstance": api_id},
         "senderData": _mk_sender(entry),
-        "messageData": {},
+        "messageData": mdata,
     }
 
-    mtype: str = entry["typeMessage"]
-    mdata: dict[str, Any] = {"typeMessage": mtype}
-    payload["messageData"] = mdata
-
-    if mtype == "textMessage":
-        mdata["textMessageData"] = {"textMessage": entry["textMessage"]}
+    handler = _HANDLERS.get(mtype)
+    if handler is not None:
+        handler(entry, mdata)
 
-    elif mtype == "extendedTextMessage":
-        txt = entry.get("textMessage") or entry["extendedTextMessage"]["text"]
-        mdata["extendedTextMessageData"] = {"text": txt}
-
-    elif mtype == "reactionMessage":
-        # extendedTextMessageData
-        mdata["extendedTextMessageData"] = entry["extendedTextMessageData"]
-        if "quotedMessage" in entry:
-            mdata["quotedMessage"] = entry["quotedMessage"]
-
-    elif mtype == "quotedMessage":
-        mdata["extendedTextMessageData"] = entry["extendedTextMessage"]
-        mdata["quotedMessage"] = entry["quotedMessage"]
-
-    elif mtype in _FILE_MTYPES:
-        mdata["fileMessageData"] = _file_section(entry)
+    if "statusMessage" in entry:
+        payload["status"] = entry["statusMessage"]
 
-    elif mtype == "locationMessage":
-        mdata["locationMessageData"] = entry["location"]
+    return payload
 
-    elif mtype == "contactMessage":
-        mdata["contactMessageData"] = entry["contact"]
 
-    elif mtype == "contactsArrayMessage":
-        mdata["messageData"] = {"contacts": entry["contacts"]}
+async def _get_chat_history(client: GreenAPIClient, chat_id: str) -> list[dict]:
+    """getChatHistory, exponential backoff on 429"""
+    for attempt in range(1, _THROTTLE_RETRIES + 1):
+        try:
+            return await client.get_chat_history(chat_id=chat_id, count=_DOWNLOAD_LIMIT)
+        except GreenAPIThrottleError:
+            if attempt == _THROTTLE_RETRIES:
+                raise
+            await asyncio.sleep(2 ** attempt)
 
-    elif mtype in {"pollMessage", "pollUpdateMessage"}:
-        mdata["pollMessageData"] = entry["pollMessageData"]
 
-    elif mtype == "interactiveButtons":
-        mdata["interactiveButtons"] = entry["interactiveButtons"]
+def _record(obj: Message | MessageFile, cols: list[Column]) -> tuple:
+    """ COPY record of transient ORM obj: python-side column defaults applied, enums by name (as stored) """
+    out = []
+    for c in cols:
+        v = getattr(obj, c.key)
+        if v is None and c.default is not None:
+            v = c.default.arg(None) if c.default.is_callable else c.default.arg
+        if isinstance(v, enum.Enum):
+            v = v.name
+        out.append(v)
+    return tuple(out)
 
-    if "statusMessage" in entry:
-        payload["status"] = entry["statusMessage"]
 
-    return payload
+async def _save_batch(db: AsyncSession, batch: list[Message]) -> int:
+    """
+    Bulk insert through COPY: records -> temp table -> INSERT ... SELECT ... ON CONFLICT DO NOTHING
+    (a webhook may have saved some of them meanwhile), files -> COPY with returned ids.
+    Returns number of saved rows
+    """
+    if not batch:
+        return 0
+    # through the session first: opens the transaction the raw COPY runs in
+    await db.execute(text(_TMP_CREATE_SQL))
+    await db.execute(text(f"TRUNCATE {_TMP_TABLE}"))
+    raw = (await (await db.connection()).get_raw_connection()).driver_connection
+    await raw.copy_records_to_table(_TMP_TABLE, records=[_record(m, _MSG_COLS) for m in batch],
+                                    columns=_MSG_COL_NAMES)
+    ids: dict[str, int] = dict((await db.execute(text(_TMP_INSERT_SQL))).tuples().all())
+
+    files = [
+        (msg_id, *_record(f, _FILE_COLS))
+        for m in batch if m.files and (msg_id := ids.get(m.wa_message_id)) is not None
+        for f in m.files
+    ]
+    if files:
+        await raw.copy_records_to_table(MessageFile.__tablename__, records=files,
+                                        columns=["message_id", *_FILE_COL_NAMES])
+    return len(ids)
+
+
+async def _import_chat(client: GreenAPIClient, cm: ClientManager, inst: Instance, api_id: int, chat_id: str) -> str:
+    """
+    Imports one chat's history (short sessions per page), returns info line for the report
+    """
+    total_saved = total_skipped = 0
+    history = await _get_chat_history(client, chat_id)
+    total = len(history)
+    logger.info("Chat %s: history items=%s", chat_id, total)
+
+    existing: set[str] = set()
+    conv_id: int | None = None  # every entry belongs to chat_id: one conversation lookup per chat
+    # page by page; a pooled connection is held only for the existence check and for COPY + commit,
+    # never while media of the page is downloaded
+    while history:
+        page, history = history[:_PAGE], history[_PAGE:]
+        async with async_session_maker() as db:
+            existing.update(await db.scalars(
+                select(Message.wa_message_id).where(
+                    Message.instance_id == inst.id,
+                    Message.wa_message_id.in_([e["idMessage"] for e in page]),
+                )
+            ))
+        batch: list[Message] = []
+        for entry in page:
+            wa_id = entry["idMessage"]
+            if wa_id in existing:
+                total_skipped += 1
+                continue
+            existing.add(wa_id)  # duplicates inside history itself
+
+            payload = history_entry_to_payload(entry, api_id)
+            msg = await payload_to_msg(payload,
+                                       db_instance=inst,
+                                       im=cm,
+                                       incoming=entry["type"] == "incoming",
+                                       archived=True)
+            if msg is None:
+                total_skipped += 1
+                continue
+            msg.is_archived = True
+            batch.append(msg)
+        if not batch:
+            continue
+        # a webhook may have saved some of them meanwhile: _save_batch skips those (ON CONFLICT)
+        async with async_session_maker() as db:
+            if conv_id is None:
+                # commit=False: created together with the first page
+                conv_id = (await get_or_create_conversation(db, instance_id=inst.id, chat_id=chat_id,
+                                                            phone=chat_id.rsplit("@", 1)[0],
+                                                            chat_name=batch[0].chat_name,
+                                                            commit=False)).id
+            for msg in batch:
+                msg.conversation_id = conv_id
+            saved = await _save_batch(db, batch)
+            await db.commit()
+        total_saved += saved
+        total_skipped += len(batch) - saved
+    short_chat = chat_id.partition("@")[0]
+    info = (f"Чат {chat_id} (https://wapanel.ru/chat/{api_id}/{short_chat}, {total} "
+            f"сообщений): сохранено: {total_saved}, пропущено: {total_skipped}\n")
+    logger.info("Download history for %s finished: saved=%s, skipped=%s", chat_id, total_saved,
+                total_skipped)
+    return info
+
+
+async def _resolve_inst(api_id: int) -> Instance | None:
+    """ internal Instance in its own short session (runs alongside Green API reads) """
+    async with async_session_maker() as db:
+        return await resolve_instance(api_id, db)
 
 
 # main routine
 async def load_history(app, api_id: int, *, wait_authorized: bool = False) -> None:
     cm: ClientManager = app["client_manager"]
-    lock = history_lock.setdefault(api_id, asyncio.Lock())
 
     await _notify(app, api_id, f"Запущена задача загрузки истории сообщений для инстанса {api_id}...")
     logger.info("Download history for %s started (wait_auth=%s)", api_id, wait_authorized)
 
+    # one client for the whole run
     async with cm.get_client(api_id) as client:
         if wait_authorized:
             for _ in range(30):
@@ -249,64 +450,37 @@ async def load_history(app, api_id: int, *, wait_authorized: bool = False) -> No
                                            f"сообщений. Пожалуйста войдите в инстанс и повторите попытку.")
                 raise RuntimeError("instance not authorized")
 
-        # last messages for past 10 years
+        # last messages for past 10 years (independent reads -> concurrently)
         minutes = 365 * 24 * 60 * 10    # ~5mils
-        inc = await client.last_incoming(minutes=minutes)
-        out = await client.last_outgoing(minutes=minutes)
-        chat_ids = {m["chatId"] for m in (*inc, *out)}
+        inc, out, inst = await asyncio.gather(client.last_incoming(minutes=minutes),
+                                              client.last_outgoing(minutes=minutes),
+                                              _resolve_inst(api_id))
+        chat_ids = list({m["chatId"] for m in (*inc, *out)})
         await _notify(app, api_id, f"Для инстанса {api_id} получено {len(inc)} входящих и {len(out)} исходящих "
                                    f"сообщений, сохраняю...")
         logger.info("Instance %s: lastIncoming=%s, lastOutgoing=%s", api_id, len(inc), len(out))
 
-    # internal inst id
-    async with async_session_maker() as db:
-        inst_db_id = await db.scalar(select(Instance.id).where(Instance.api_id == api_id))
-        if inst_db_id is None:
+        # internal inst
+        if inst is None:
             await _notify(app, api_id, f"Что-то пошло не так, инстанс {api_id} больше не найден в БД...")
             logger.error("Instance %s vanished from DB", api_id)
             return
 
+        # getChatHistory per chat, _CHAT_CONCURRENCY at a time; at most half of the pool,
+        # the rest stays for webhooks / listeners
+        sem = asyncio.Semaphore(max(1, min(_CHAT_CONCURRENCY, settings.pool_size // 2)))
+
+        async def _wrapped(cid: str) -> str:
+            async with sem:
+                return await _import_chat(client, cm, inst, api_id, cid)
+
+        results = await asyncio.gather(*(_wrapped(c) for c in chat_ids), return_exceptions=True)
+
     info = ""
-    # getChatHistory per chat
-    async with cm.get_client(api_id) as client:
-        for chat_id in chat_ids:
-            try:
-                total_saved = total_skipped = 0
-                history = await client.get_chat_history(chat_id=chat_id, count=_DOWNLOAD_LIMIT)
-                logger.info("Chat %s: history items=%s", chat_id, len(history))
-
-                async with async_session_maker() as db:
-                    for entry in history:
-                            wa_id = entry["idMessage"]
-                            exists = await db.scalar(
-                                select(Message.id).where(
-                                    Message.instance_id == inst_db_id,
-                                    Message.wa_message_id == wa_id,
-                                ).limit(1)
-                            )
-                            if exists:
-                                total_skipped += 1
-                                continue
-
-                            payload = history_entry_to_payload(entry, api_id)
-                            msg = await payload_to_msg(payload,
-                                                       db,
-                                                       db_instance_id=inst_db_id,
-                                                       im=cm,
-                                                       incoming=entry["type"] == "incoming",
-                                                       archived=True)
-                            if msg is None:
-                                total_skipped += 1
-                                continue
-                            msg.is_archived = True
-                            db.add(msg)
-                            total_saved += 1
-                    await db.commit()
-                info += (f"Чат {chat_id} (https://wapanel.ru/chat/{api_id}/{chat_id.rsplit("@", 1)[0]}, {len(history)} "
-                         f"сообщений): сохранено: {total_saved}, пропущено: {total_skipped}\n")
-                logger.info("Download history for %s finished: saved=%s, skipped=%s", chat_id, total_saved,
-                            total_skipped)
-            except Exception as e:
-                info += f"Чат {chat_id}: не удалось загрузить историю чата\n"
-                logger.error(f"Download history for {chat_id} failed: {e}")
+    for chat_id, res in zip(chat_ids, results):
+        if isinstance(res, BaseException):
+            info += f"Чат {chat_id}: не удалось загрузить историю чата\n"
+            logger.error(f"Download history for {chat_id} failed: {res}")
+        else:
+            info += res
     await _notify(app, api_id, f"Загрузка сообщений для инстанса {api_id} завершена\n{info}")
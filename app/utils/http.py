@@ -0,0 +1,11 @@
+from typing import Any
+
+import orjson
+from aiohttp import web
+
+
+def orjson_response(obj: Any, *, status: int = 200) -> web.Response:
+    """
+    web.json_response analogue, serialized with orjson
+    """
+    return web.Response(body=orjson.dumps(obj), status=status, content_type="application/json")
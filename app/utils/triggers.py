@@ -1,5 +1,123 @@
+from typing import Final
+
 import asyncpg
 
+_NOTIFY_CHUNK: Final = 500  # ids per NOTIFY payload (payload limit is 8000 bytes)
+
+# instance_change trigger:
+# instance insert, update or delete. Used for Green API Client Manager
+# for delete we also send api_id
+_SQL_INSTANCE: Final = """
+    CREATE OR REPLACE FUNCTION notify_instance_change() RETURNS trigger AS $$
+    DECLARE payload text;
+    BEGIN
+        -- fixed-shape payloads (ints only): plain text, no json building
+        IF TG_OP = 'DELETE' THEN
+            payload := format('{"action":"delete","id":%s,"api_id":%s}', OLD.id, OLD.api_id);
+        ELSIF TG_OP = 'UPDATE' THEN
+            payload := format('{"action":"update","id":%s}', NEW.id);
+        ELSE
+            payload := format('{"action":"insert","id":%s}', NEW.id);
+        END IF;
+        PERFORM pg_notify('instance_change', payload);
+        RETURN COALESCE(NEW, OLD);
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS trg_notify_instance_change ON instances;
+    CREATE TRIGGER trg_notify_instance_change
+    AFTER INSERT OR UPDATE OR DELETE ON instances
+    FOR EACH ROW EXECUTE FUNCTION notify_instance_change();
+"""
+
+# msg_in trigger:
+# New System / Incoming Message (insert only) -> used for telegram channel notifications
+# statement-level: one NOTIFY {"msg_ids": [...]} per _NOTIFY_CHUNK rows of a statement,
+# archived (history import) rows are skipped
+_SQL_MSG_IN: Final = """
+    CREATE OR REPLACE FUNCTION notify_msg_in() RETURNS trigger AS $$
+    DECLARE ids int[];
+    BEGIN
+        FOR ids IN
+            SELECT array_agg(id ORDER BY id) FROM (
+                SELECT id, (row_number() OVER (ORDER BY id) - 1) / %(chunk)s AS g
+                FROM nt
+                WHERE direction IN ('sys', 'inc') AND is_archived IS NOT TRUE
+            ) s GROUP BY g ORDER BY g
+        LOOP
+            PERFORM pg_notify('msg_in', '{"msg_ids":[' || array_to_string(ids, ',') || ']}');
+        END LOOP;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS trg_notify_msg_in ON messages;
+    CREATE TRIGGER trg_notify_msg_in
+    AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS nt
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_msg_in();
+""" % {"chunk": _NOTIFY_CHUNK}
+
+# msg_out trigger:
+# new outgoing message created with status == pending, we send it through Green API
+# statement-level, same payload as msg_in
+_SQL_MSG_OUT: Final = """
+    CREATE OR REPLACE FUNCTION notify_msg_out() RETURNS trigger AS $$
+    DECLARE ids int[];
+    BEGIN
+        FOR ids IN
+            SELECT array_agg(id ORDER BY id) FROM (
+                SELECT id, (row_number() OVER (ORDER BY id) - 1) / %(chunk)s AS g
+                FROM nt
+                WHERE direction = 'out' AND status = 'pending'
+            ) s GROUP BY g ORDER BY g
+        LOOP
+            PERFORM pg_notify('msg_out', '{"msg_ids":[' || array_to_string(ids, ',') || ']}');
+        END LOOP;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS trg_notify_msg_out ON messages;
+    CREATE TRIGGER trg_notify_msg_out
+    AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS nt
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_msg_out();
+""" % {"chunk": _NOTIFY_CHUNK}
+
+# conversation last message + unread counter (dialog list reads conversations only):
+# every inserted message (archived and outgoing too), statement-level, one UPDATE per statement;
+# older messages (history import) don't overwrite a newer last message
+_SQL_CONV_LAST: Final = """
+    CREATE OR REPLACE FUNCTION conv_last_message() RETURNS trigger AS $$
+    BEGIN
+        UPDATE conversations c
+        SET last_message_text = CASE WHEN c.last_message_at IS NULL OR l.created_at >= c.last_message_at
+                                     THEN l.text ELSE c.last_message_text END,
+            last_message_direction = CASE WHEN c.last_message_at IS NULL OR l.created_at >= c.last_message_at
+                                          THEN l.direction ELSE c.last_message_direction END,
+            last_message_at = GREATEST(c.last_message_at, l.created_at),
+            unread_inc_count = c.unread_inc_count + l.unread
+        FROM (
+            SELECT DISTINCT ON (conversation_id)
+                   conversation_id, LEFT(text, 512) AS text, direction, created_at,
+                   count(*) FILTER (WHERE direction = 'inc' AND is_seen IS FALSE)
+                       OVER (PARTITION BY conversation_id) AS unread
+            FROM nt
+            WHERE conversation_id IS NOT NULL
+            ORDER BY conversation_id, created_at DESC, id DESC
+        ) l
+        WHERE c.id = l.conversation_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS trg_conv_last_message ON messages;
+    CREATE TRIGGER trg_conv_last_message
+    AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS nt
+    FOR EACH STATEMENT EXECUTE FUNCTION conv_last_message();
+"""
 
 async def init_triggers_pg(settings):
     """
@@ -7,6 +125,8 @@ async def init_triggers_pg(settings):
     1. instance changes insert/update/delete
     2. incoming db messages insert
     3. outgoing db messages (status == pending) insert
+    4. conversation last message / unread counter on messages insert
+    One transaction (all or nothing), serialized between replicas booting at the same time
     """
     conn = await asyncpg.connect(
         user=settings.postgres_user,
@@ -15,76 +135,13 @@ async def init_triggers_pg(settings):
         host=settings.postgres_host,
         port=settings.postgres_port,
     )
-
-    # instance_change trigger:
-    # instance insert, update or delete. Used for Green API Client Manager
-    # for delete we also send api_id
-    await conn.execute(
-        """
-        CREATE OR REPLACE FUNCTION notify_instance_change() RETURNS trigger AS $$
-        DECLARE payload json;
-        BEGIN
-            IF TG_OP = 'DELETE' THEN
-                payload := json_build_object('action','delete', 'id',OLD.id, 'api_id',OLD.api_id);
-            ELSIF TG_OP = 'UPDATE' THEN
-                payload := json_build_object('action','update', 'id',NEW.id);
-            ELSE
-                payload := json_build_object('action','insert', 'id',NEW.id);
-            END IF;
-            PERFORM pg_notify('instance_change',payload::text);
-            RETURN COALESCE(NEW, OLD);
-        END;
-        $$ LANGUAGE plpgsql;
-
-        DROP TRIGGER IF EXISTS trg_notify_instance_change ON instances;
-        CREATE TRIGGER trg_notify_instance_change
-        AFTER INSERT OR UPDATE OR DELETE ON instances
-        FOR EACH ROW EXECUTE FUNCTION notify_instance_change();
-        """
-    )
-
-    # msg_in trigger:
-    # New System / Incoming Message (insert only) -> used for telegram channel notifications
-    await conn.execute(
-        """
-        CREATE OR REPLACE FUNCTION notify_msg_in() RETURNS trigger AS $$
-        DECLARE payload json;
-        BEGIN
-            IF (NEW.direction = 'sys') OR (NEW.direction = 'inc') THEN
-                payload := json_build_object('msg_id', NEW.id);
-                PERFORM pg_notify('msg_in',payload::text);
-            END IF;
-            RETURN NEW;
-        END;
-        $$ LANGUAGE plpgsql;
-
-        DROP TRIGGER IF EXISTS trg_notify_msg_in ON messages;
-        CREATE TRIGGER trg_notify_msg_in
-        AFTER INSERT ON messages
-        FOR EACH ROW EXECUTE FUNCTION notify_msg_in();
-        """
-    )
-
-    # msg_out trigger:
-    # new outgoing message created with status == pending, we send it through Green API
-    await conn.execute(
-        """
-        CREATE OR REPLACE FUNCTION notify_msg_out() RETURNS trigger AS $$
-        DECLARE payload json;
-        BEGIN
-            IF (NEW.direction = 'out') AND (NEW.status = 'pending') THEN
-                payload := json_build_object('msg_id', NEW.id);
-                PERFORM pg_notify('msg_out', payload::text);
-            END IF;
-            RETURN NEW;
-        END;
-        $$ LANGUAGE plpgsql;
-
-        DROP TRIGGER IF EXISTS trg_notify_msg_out ON messages;
-        CREATE TRIGGER trg_notify_msg_out
-        AFTER INSERT ON messages
-        FOR EACH ROW EXECUTE FUNCTION notify_msg_out();
-        """
-    )
-
-    await conn.close()
+    try:
+        async with conn.transaction():
+            # one simple-protocol round-trip for the whole script
+            await conn.execute(
+                "SET LOCAL lock_timeout = '5s';"
+                "SELECT pg_advisory_xact_lock(hashtext('init_triggers'));"
+                + _SQL_INSTANCE + _SQL_MSG_IN + _SQL_MSG_OUT + _SQL_CONV_LAST
+            )
+    finally:
+        await conn.close()
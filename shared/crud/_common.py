@@ -0,0 +1,49 @@
+from typing import Any, Mapping
+
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+async def update_row(
+    session: AsyncSession,
+    obj: Any,
+    values: Mapping[str, Any],
+    *,
+    commit: bool = True
+) -> None:
+    """
+    UPDATE of changed columns only, RETURNING them (+ onupdate columns) straight into obj:
+    one statement, no refresh SELECT, loaded relationships are left as they are.
+    Unknown keys are ignored
+    """
+    table = obj.__table__
+    changed = {k: v for k, v in values.items() if k in table.c and getattr(obj, k) != v}
+    if changed:
+        back = [table.c[k] for k in changed]
+        back += [c for c in table.c if c.onupdate is not None and c.key not in changed]
+        row = (await session.execute(
+            update(table).where(table.c.id == obj.id).values(changed).returning(*back)
+        )).one()
+        for col, value in zip(back, row):
+            set_committed_value(obj, col.key, value)
+    if commit:
+        await session.commit()
+
+
+async def delete_row(
+    session: AsyncSession,
+    obj: Any,
+    *,
+    commit: bool = True
+) -> None:
+    """
+    DELETE by primary key; children are removed by FK ON DELETE CASCADE on the server,
+    so nothing is loaded for ORM cascades. obj is detached afterwards
+    """
+    table = obj.__table__
+    await session.execute(delete(table).where(table.c.id == obj.id))
+    if obj in session:
+        session.expunge(obj)
+    if commit:
+        await session.commit()
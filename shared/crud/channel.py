@@ -1,42 +1,76 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import delete, select, func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from shared.models import TelegramChannel
+from shared.models import TelegramChannel, Instance
 
 
 async def get_or_create(
     session: AsyncSession,
     telegram_id: int,
-    defaults: Optional[Dict[str, Any]] = None
+    defaults: Optional[Dict[str, Any]] = None,
+    *,
+    commit: bool = True
 ) -> TelegramChannel:
     """
     Gets or creates TelegramChannel object.
+    commit=False: caller's transaction (e.g. instance write) commits both at once
     Example:
     channel = await get_or_create(session, telegram_id=-88005553535, defaults={
         "name": "Test Channel"
     })
     """
-    q = select(TelegramChannel).where(TelegramChannel.telegram_id == telegram_id)
-    result = await session.execute(q)
-    channel = result.scalars().first()
-    if channel:
-        return channel
+    # INSERT ... ON CONFLICT (telegram_id) DO UPDATE (no-op) RETURNING * -> one round-trip, no race
+    stmt = pg_insert(TelegramChannel).values(telegram_id=telegram_id, **(defaults or {}))
+    stmt = (
+        stmt.on_conflict_do_update(index_elements=[TelegramChannel.telegram_id],
+                                   set_={"telegram_id": stmt.excluded.telegram_id})
+        .returning(TelegramChannel)
+        .execution_options(populate_existing=True)
+    )
+    channel = (await session.execute(stmt)).scalar_one()
+    if commit:
+        await session.commit()
+    return channel
 
-    params = {"telegram_id": telegram_id}
-    if defaults:
-        params.update(defaults)
 
-    channel = TelegramChannel(**params)
-    session.add(channel)
-    await session.commit()
-    await session.refresh(channel)
-    return channel
+async def upsert_channel(
+    session: AsyncSession,
+    telegram_id: int,
+    *,
+    commit: bool = True,
+    **values: Any
+) -> List[int]:
+    """
+    INSERT ... ON CONFLICT (telegram_id) DO UPDATE + api_ids of channel's instances, one query.
+    Commits (unless commit=False). Returns api_ids (empty list if none).
+    Example:
+    api_ids = await upsert_channel(session, telegram_id=-88005553535, name="Name", is_active=True)
+    """
+    up = (
+        pg_insert(TelegramChannel)
+        .values(telegram_id=telegram_id, **values)
+        .on_conflict_do_update(index_elements=[TelegramChannel.telegram_id], set_=values)
+        .returning(TelegramChannel.id)
+        .cte("up")
+    )
+    api_ids = await session.scalar(
+        select(func.array_agg(Instance.api_id))
+        .select_from(up)
+        .join(Instance, Instance.telegram_channel_id == up.c.id, isouter=True)
+        .where(Instance.api_id.is_not(None))
+    )
+    if commit:
+        await session.commit()
+    return api_ids or []
 
 
 async def update_channel(
     session: AsyncSession,
     telegram_id: int,
+    *,
+    commit: bool = True,
     **kwargs: Any
 ) -> Optional[TelegramChannel]:
     """
@@ -44,37 +78,41 @@ async def update_channel(
     Example:
     channel = await update_channel(session, telegram_id=-88005553535, name="Name from Telegram API")
     """
-    q = select(TelegramChannel).where(TelegramChannel.telegram_id == telegram_id)
-    result = await session.execute(q)
-    channel = result.scalars().first()
-    if not channel:
-        return None
+    values = {field: value for field, value in kwargs.items() if hasattr(TelegramChannel, field)}
+    if not values:
+        return await get_channel(session, telegram_id)
 
-    for field, value in kwargs.items():
-        if hasattr(channel, field):
-            setattr(channel, field, value)
-
-    await session.commit()
-    await session.refresh(channel)
+    # UPDATE ... RETURNING * -> one round-trip
+    channel = (await session.execute(
+        update(TelegramChannel)
+        .where(TelegramChannel.telegram_id == telegram_id)
+        .values(**values)
+        .returning(TelegramChannel)
+        .execution_options(populate_existing=True)
+    )).scalar_one_or_none()
+    if commit:
+        await session.commit()
     return channel
 
 
 async def delete_channel(
     session: AsyncSession,
-    telegram_id: int
+    telegram_id: int,
+    *,
+    commit: bool = True
 ) -> bool:
     """
     Deletes TelegramChannel object. If deleted, returns True, otherwise - False.
     """
-    q = select(TelegramChannel).where(TelegramChannel.telegram_id == telegram_id)
-    result = await session.execute(q)
-    channel = result.scalars().first()
-    if not channel:
-        return False
-
-    await session.delete(channel)
-    await session.commit()
-    return True
+    # instances (and their data) go with FK cascade
+    deleted = await session.scalar(
+        delete(TelegramChannel).where(TelegramChannel.telegram_id == telegram_id)
+        .returning(TelegramChannel.id)
+        .execution_options(synchronize_session=False)
+    )
+    if commit:
+        await session.commit()
+    return deleted is not None
 
 
 async def get_channel(
@@ -1,12 +1,14 @@
-from sqlalchemy import select, or_, update, func, distinct, case
+from sqlalchemy import select, or_, update, func, case, exists
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import contains_eager
+from sqlalchemy.orm import contains_eager, selectinload
 
-from shared.models import Conversation, conversation_tags, Message, MessageDirection, Instance
+from shared.models import Conversation, conversation_tags, Message, MessageDirection
 
 
 async def get_or_create_conversation(session, *, instance_id: int, chat_id: str,
-                                     phone: str | None = None, chat_name: str | None = None) -> Conversation:
+                                     phone: str | None = None, chat_name: str | None = None,
+                                     commit: bool = True) -> Conversation:
     stmt = select(Conversation).where(
         Conversation.instance_id == instance_id,
         Conversation.chat_id == chat_id,
@@ -15,16 +17,22 @@ async def get_or_create_conversation(session, *, instance_id: int, chat_id: str,
     if conv:
         return conv
 
-    conv = Conversation(
+    # miss: INSERT ... ON CONFLICT (uq_conv_instance_chat) DO UPDATE (no-op) RETURNING * ->
+    # one round-trip instead of INSERT + refresh, and a concurrent insert just returns the existing row
+    ins = pg_insert(Conversation).values(
         instance_id=instance_id,
         chat_id=chat_id,
         phone=phone,
         title=chat_name or phone,
         is_group=chat_id.endswith("@g.us"),
     )
-    session.add(conv)
-    await session.commit()
-    await session.refresh(conv)
+    conv = (await session.execute(
+        ins.on_conflict_do_update(constraint="uq_conv_instance_chat", set_={"chat_id": ins.excluded.chat_id})
+        .returning(Conversation)
+        .execution_options(populate_existing=True)
+    )).scalar_one()
+    if commit:
+        await session.commit()
     return conv
 
 
@@ -41,20 +49,9 @@ async def fetch_dialogs(
     Возвращает список словарей с полями:
     id, chat_id, title, phone, last_message_at, last_message, unread
     """
-    m, c, i = Message.__table__, Conversation.__table__, Instance.__table__
-
-    last_msg = (
-        select(
-            Message.conversation_id,
-            Message.text,
-            Message.direction,
-            Message.created_at.label("msg_at")
-        )
-        .order_by(Message.conversation_id, Message.created_at.desc())
-        .distinct(Message.conversation_id)
-        .cte("last_msg")
-    )
+    c = Conversation.__table__
 
+    # last message / unread are kept on conversations by DB trigger -> no messages scan
     stmt = (
         select(
             c.c.id,
@@ -62,35 +59,30 @@ async def fetch_dialogs(
             c.c.title,
             c.c.phone,
 
-            last_msg.c.msg_at.label("last_message_at"),
+            c.c.last_message_at,
             case(
-                (last_msg.c.direction == MessageDirection.out, "Вы: "),
-                (last_msg.c.direction == MessageDirection.sys, "INFO: "),
+                (c.c.last_message_direction == MessageDirection.out, "Вы: "),
+                (c.c.last_message_direction == MessageDirection.sys, "INFO: "),
                 else_=""
-            ).concat(last_msg.c.text).label("last_message"),
+            ).concat(c.c.last_message_text).label("last_message"),
 
-            func.count(distinct(m.c.id)).filter(
-                (m.c.direction == MessageDirection.inc) &
-                (m.c.is_seen.is_(False))
-            ).label("unread"),
-        )
-        .join(last_msg, last_msg.c.conversation_id == c.c.id, isouter=True)
-        .join(m, m.c.conversation_id == c.c.id)
-        .where(c.c.instance_id == instance_id)
-        .group_by(
-            c.c.id, c.c.chat_id, c.c.title, c.c.phone,
-            last_msg.c.msg_at, last_msg.c.text, last_msg.c.direction,
+            c.c.unread_inc_count.label("unread"),
         )
+        # conversations without messages are not listed
+        .where(c.c.instance_id == instance_id, c.c.last_message_at.is_not(None))
     )
 
     if tag_ids:
-        stmt = stmt.join(conversation_tags).where(conversation_tags.c.tag_id.in_(tag_ids))
+        stmt = stmt.where(exists().where(
+            conversation_tags.c.conversation_id == c.c.id,
+            conversation_tags.c.tag_id.in_(tag_ids),
+        ))
     if q:
         like = f"%{q}%"
         stmt = stmt.where((c.c.title.ilike(like)) | (c.c.phone.ilike(like)))
 
     stmt = (
-        stmt.order_by(c.c.pinned.desc(), last_msg.c.msg_at.desc().nullslast())
+        stmt.order_by(c.c.pinned.desc(), c.c.last_message_at.desc().nullslast())
             .limit(limit).offset(offset)
     )
 
@@ -110,35 +102,18 @@ async def list_conversations(
     """
     Список чатов с последним сообщением и счётчиком непрочитанных.
     """
-    m = Message.__table__
-    c = Conversation.__table__
-
-    # CTE с последним сообщением
-    last_msg = (
-        select(
-            Message.conversation_id,
-            Message.id.label("msg_id"),
-            Message.text,
-            Message.direction,
-            Message.created_at.label("msg_at")
-        )
-        .order_by(Message.conversation_id, Message.created_at.desc())
-        .distinct(Message.conversation_id)
-        .cte("last_msg")
-    )
-
     stmt = (
         select(Conversation)
-        .join(last_msg, last_msg.c.conversation_id == Conversation.id, isouter=True)
+        .options(selectinload(Conversation.tags))
         .where(Conversation.instance_id == instance_id)
     )
 
     # фильтры по тегам / поиску
     if tag_ids:
-        stmt = (
-            stmt.join(conversation_tags)
-                .where(conversation_tags.c.tag_id.in_(tag_ids))
-        )
+        stmt = stmt.where(exists().where(
+            conversation_tags.c.conversation_id == Conversation.id,
+            conversation_tags.c.tag_id.in_(tag_ids),
+        ))
     if q:
         like = f"%{q}%"
         stmt = stmt.where(
@@ -147,7 +122,7 @@ async def list_conversations(
 
     stmt = (
         stmt.order_by(Conversation.pinned.desc(),
-                      last_msg.c.msg_at.desc().nullslast())
+                      Conversation.last_message_at.desc().nullslast())
         .limit(limit)
         .offset(offset)
     )
@@ -162,6 +137,7 @@ async def mark_all_messages_seen(
     conversation_id: int | None = None,
     instance_id: int | None = None,
     chat_id: str | None = None,
+    commit: bool = True,
 ) -> int:
     """
     Помечает все входящие сообщения диалога как прочитанные
@@ -206,7 +182,8 @@ async def mark_all_messages_seen(
             .values(unread_inc_count=0)
         )
 
-    await session.commit()
+    if commit:
+        await session.commit()
     return updated_rows
 
 
@@ -236,8 +213,9 @@ async def mark_conversation_read(session, *, conversation_id: int):
 async def search_messages(session: AsyncSession, *, instance_id: int, q: str,
                           conversation_id: int | None = None, limit: int = 50, offset: int = 0):
     query = func.websearch_to_tsquery('russian', q)
-    stmt = select(Message).join(Conversation).where(
-        Conversation.instance_id == instance_id,
+    # Message.instance_id (not Conversation's): both columns of GIN ix_msg_text_search are used
+    stmt = select(Message).options(selectinload(Message.files)).where(
+        Message.instance_id == instance_id,
         Message.text_search.op('@@')(query)
     )
     if conversation_id:
@@ -246,4 +224,4 @@ async def search_messages(session: AsyncSession, *, instance_id: int, q: str,
     stmt = stmt.order_by(func.ts_rank_cd(Message.text_search, query).desc(),
                          Message.created_at.desc()).limit(limit).offset(offset)
     res = await session.execute(stmt)
-    return list(res.scalars())
+    return res.scalars().all()
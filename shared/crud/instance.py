@@ -1,61 +1,73 @@
 from typing import Optional, List, Any
-from sqlalchemy import select, delete
+from sqlalchemy import bindparam, select, delete, exists
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import raiseload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
-from shared.models import Instance, User
+from shared.models import Instance, User, user_instance_access
+from shared.crud._common import delete_row, update_row
 from shared.crud.channel import get_or_create as get_or_create_channel
 
 
+def _load_opts(strict: bool) -> tuple:
+    """
+    telegram_channel only; strict -> any other relationship (messages, conversations, users)
+    raises on access instead of being selectin-loaded / lazy-loaded
+    """
+    opts = (selectinload(Instance.telegram_channel),)
+    return (*opts, raiseload("*")) if strict else opts
+
+
+# built once, ids are bound at execution (strict -> statement)
+_BY_ID = {s: select(Instance).options(*_load_opts(s)).where(Instance.id == bindparam("instance_id"))
+          for s in (True, False)}
+_BY_API_ID = {s: select(Instance).options(*_load_opts(s)).where(Instance.api_id == bindparam("api_id"))
+              for s in (True, False)}
+
+
 async def list_instances(
     session: AsyncSession,
-    *, user: User
+    *, user: User,
+    strict: bool = True
 ) -> List[Instance]:
     """
     Returns all instances (with telegram channels loaded)
     """
     if user.full_access or user.is_owner:
-        q = select(Instance).options(selectinload(Instance.telegram_channel))
+        q = select(Instance).options(*_load_opts(strict))
     else:
+        # EXISTS on the m2m table only (its PK is (user_id, instance_id)) instead of JOIN through users
+        access = user_instance_access.c
         q = (select(Instance)
-             .join(Instance.users)
-             .where(User.id == user.id)
-             .options(selectinload(Instance.telegram_channel))
+             .where(exists().where(access.instance_id == Instance.id, access.user_id == user.id))
+             .options(*_load_opts(strict))
              )
-    return list((await session.execute(q)).scalars().all())
+    return (await session.execute(q)).scalars().all()
 
 
 async def get_instance_by_id(
     session: AsyncSession,
     *,
-    instance_id: int
+    instance_id: int,
+    strict: bool = True
 ) -> Optional[Instance]:
     """
     Get Instance by internal ID
     """
-    stmt = (
-        select(Instance)
-        .options(selectinload(Instance.telegram_channel))
-        .where(Instance.id == instance_id)
-    )
-    result = await session.execute(stmt)
+    result = await session.execute(_BY_ID[strict], {"instance_id": instance_id})
     return result.scalars().first()
 
 
 async def get_instance_by_api_id(
     session: AsyncSession,
     *,
-    api_id: int
+    api_id: int,
+    strict: bool = True
 ) -> Optional[Instance]:
     """
     Get instance by API_ID
     """
-    stmt = (
-        select(Instance)
-        .options(selectinload(Instance.telegram_channel))
-        .where(Instance.api_id == api_id)
-    )
-    result = await session.execute(stmt)
+    result = await session.execute(_BY_API_ID[strict], {"api_id": api_id})
     return result.scalars().first()
 
 
@@ -70,15 +82,18 @@ async def create_instance(
     auto_reply: bool = False,
     auto_reply_text: Optional[str] = None,
     inst_name: Optional[str] = None,
+    commit: bool = True,
 ) -> Instance:
     """
     Create new Instance and TelegramChannel if needed
     :telegram_channel_tg_id: Telegram Channel ID
     """
+    # same transaction as the instance INSERT -> single commit
     channel = await get_or_create_channel(
         session,
         telegram_id=telegram_channel_tg_id,
-        defaults={}
+        defaults={},
+        commit=False,
     )
 
     inst = Instance(
@@ -90,44 +105,50 @@ async def create_instance(
         telegram_channel=channel,
         auto_reply=auto_reply,
         auto_reply_text=auto_reply_text,
+        # new row: collections are known to be empty, nothing to load later
+        messages=[],
+        conversations=[],
+        users=[],
     )
     session.add(inst)
-    await session.commit()
-    await session.refresh(inst)
+    # id / defaults come back with INSERT ... RETURNING, no refresh SELECT
+    if commit:
+        await session.commit()
+    else:
+        await session.flush()
     return inst
 
 
 async def update_instance(
     session: AsyncSession,
     instance: Instance,
+    *,
+    commit: bool = True,
     **kwargs: Any
 ) -> Instance:
     """
-    Updates Instance
+    Updates Instance (single UPDATE ... RETURNING of changed columns)
     :telegram_channel_tg_id: Telegram Channel ID (Optional)
     """
     tg_id = kwargs.pop("telegram_channel_tg_id", None)
+    channel = None
     if tg_id is not None:
-        channel = await get_or_create_channel(session, telegram_id=tg_id, defaults={})
-        instance.telegram_channel = channel
-
-    for field, value in kwargs.items():
-        if hasattr(instance, field):
-            setattr(instance, field, value)
+        channel = await get_or_create_channel(session, telegram_id=tg_id, defaults={}, commit=False)
+        kwargs["telegram_channel_id"] = channel.id
 
-    session.add(instance)
-    await session.commit()
-    await session.refresh(instance)
+    await update_row(session, instance, kwargs, commit=commit)
+    if channel is not None:
+        set_committed_value(instance, "telegram_channel", channel)
     return instance
 
 
 async def delete_instance(
     session: AsyncSession,
     *,
-    instance: Instance
+    instance: Instance,
+    commit: bool = True
 ) -> None:
     """
-    Deletes Instance and its data (messages)
+    Deletes Instance and its data (messages, files, conversations - FK cascade, one statement)
     """
-    await session.delete(instance)
-    await session.commit()
+    await delete_row(session, instance, commit=commit)
@@ -1,60 +1,88 @@
+from datetime import datetime
 from typing import Optional, List, Any
-from sqlalchemy import select, delete
+from sqlalchemy import bindparam, select, delete, func, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import joinedload, raiseload, selectinload
 
+from shared.crud._common import delete_row, update_row
 from shared.models import Message, MessageFile, MessageDirection, MessageType, MessageStatus, FileType
 
 
+def _load_opts(strict: bool, single: bool = False) -> tuple:
+    """
+    instance & files; strict -> anything else (incl. instance's own collections) raises on access
+    single (one-row lookups): JOINed into the same SELECT - one round-trip; lists keep selectin,
+    a JOIN there would repeat every message row per file
+    """
+    load = joinedload if single else selectinload
+    opts = (load(Message.instance), load(Message.files))
+    return (*opts, raiseload("*")) if strict else opts
+
+
+# built once, ids are bound at execution (strict -> statement)
+_BY_ID = {s: select(Message).options(*_load_opts(s, single=True)).where(Message.id == bindparam("message_id"))
+          for s in (True, False)}
+_BY_WA_ID = {
+    s: select(Message).options(*_load_opts(s, single=True)).where(
+        Message.instance_id == bindparam("instance_id"),
+        Message.wa_message_id == bindparam("wa_message_id"),
+    )
+    for s in (True, False)
+}
+
+
 async def list_messages(
     session: AsyncSession,
     *,
     instance_id: Optional[int] = None,
     chat_id: Optional[str] = None,
-    offset: int = 0,
-    limit: int = 100
+    before: Optional[tuple[datetime, int]] = None,
+    q: Optional[str] = None,
+    limit: int = 100,
+    strict: bool = True
 ) -> List[Message]:
     """
-    Get [Message] for instance_id & chat_id
-    Loads instance & files. Pagination support (offset, limit)
+    Get [Message] for instance_id & chat_id, newest first
+    Loads instance & files. Keyset pagination: before = (created_at, id) of the oldest message
+    of the previous page (index seek instead of scanning and discarding OFFSET rows)
+    q: full-text filter on Message.text_search (expression GIN ix_msg_text_search), same config as the index
     """
     if instance_id is None or chat_id is None:
         return []
 
-    q = select(Message).options(
-        selectinload(Message.instance),
-        selectinload(Message.files)
-    ).order_by(Message.created_at.desc())
+    stmt = select(Message).options(*_load_opts(strict)).order_by(Message.created_at.desc(), Message.id.desc())
     if instance_id is not None:
-        q = q.where(Message.instance_id == instance_id)
+        stmt = stmt.where(Message.instance_id == instance_id)
     if chat_id is not None:
-        q = q.where(Message.chat_id == chat_id)
-    q = q.offset(offset).limit(limit)
-    result = await session.execute(q)
-    return list(result.scalars().all())
+        stmt = stmt.where(Message.chat_id == chat_id)
+    if before is not None:
+        stmt = stmt.where(tuple_(Message.created_at, Message.id) < tuple_(*before))
+    if q:
+        stmt = stmt.where(Message.text_search.op("@@")(func.websearch_to_tsquery("russian", q)))
+    stmt = stmt.limit(limit)
+    result = await session.execute(stmt)
+    return result.scalars().all()
 
 
 async def get_message_by_id(
     session: AsyncSession,
     *,
-    message_id: int
+    message_id: int,
+    strict: bool = True
 ) -> Optional[Message]:
     """
     Get Message by its internal ID
     """
-    q = select(Message).options(
-        selectinload(Message.instance),
-        selectinload(Message.files)
-    ).where(Message.id == message_id)
-    result = await session.execute(q)
-    return result.scalars().first()
+    result = await session.execute(_BY_ID[strict], {"message_id": message_id})
+    return result.unique().scalars().first()
 
 
 async def get_message_by_wa_id(
     session: AsyncSession,
     *,
     instance_id: int,
-    wa_message_id: str
+    wa_message_id: str,
+    strict: bool = True
 ) -> Optional[Message]:
     """
     Get Message by Instance ID & we_message_id
@@ -65,15 +93,9 @@ async def get_message_by_wa_id(
         wa_message_id="88005553535",
     )
     """
-    q = select(Message).options(
-        selectinload(Message.instance),
-        selectinload(Message.files)
-    ).where(
-        Message.instance_id == instance_id,
-        Message.wa_message_id == wa_message_id
-    )
-    result = await session.execute(q)
-    return result.scalars().first()
+    result = await session.execute(_BY_WA_ID[strict],
+                                   {"instance_id": instance_id, "wa_message_id": wa_message_id})
+    return result.unique().scalars().first()
 
 
 async def create_message(
@@ -118,11 +140,12 @@ async def create_message(
         status=status,
         text=text,
         quote_id=quote_id,
+        files=[],
     )
     session.add(msg)
+    # id / defaults come back with INSERT ... RETURNING, no refresh SELECT
     if commit:
         await session.commit()
-        await session.refresh(msg)
     else:
         await session.flush()
     return msg
@@ -137,7 +160,8 @@ async def create_message_file(
     mime: str,
     file_path: str,
     file_url: str,
-    size: Optional[int] = None
+    size: Optional[int] = None,
+    commit: bool = True
 ) -> MessageFile:
     """
     Create and attach a MessageFile to an existing Message
@@ -165,18 +189,22 @@ async def create_message_file(
         size=size
     )
     session.add(file)
-    await session.commit()
-    await session.refresh(file)
+    if commit:
+        await session.commit()
+    else:
+        await session.flush()
     return file
 
 
 async def update_message(
     session: AsyncSession,
     message: Message,
+    *,
+    commit: bool = True,
     **kwargs: Any
 ) -> Message:
     """
-    Updates Message
+    Updates Message (single UPDATE ... RETURNING of changed columns)
     Example:
     msg = await get_message_by_wa_id(
             session,
@@ -192,22 +220,17 @@ async def update_message(
             status=MessageStatus.sent
         )
     """
-    for field, value in kwargs.items():
-        if hasattr(message, field):
-            setattr(message, field, value)
-    session.add(message)
-    await session.commit()
-    await session.refresh(message)
+    await update_row(session, message, kwargs, commit=commit)
     return message
 
 
 async def delete_message(
     session: AsyncSession,
     *,
-    message: Message
+    message: Message,
+    commit: bool = True
 ) -> None:
     """
-    Deletes Message
+    Deletes Message (files go with FK cascade)
     """
-    await session.delete(message)
-    await session.commit()
+    await delete_row(session, message, commit=commit)
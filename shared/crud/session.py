@@ -1,51 +1,76 @@
 from typing import Optional, List, Any
 from datetime import datetime, timedelta
-from sqlalchemy import select, delete
+from sqlalchemy import DateTime, bindparam, select, delete, func, tuple_, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import load_only, raiseload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
+from shared.crud._common import delete_row, update_row
+from shared.crud.user import get_instance_ids
 from shared.models import DBSession
 
 
+_TOUCH_EVERY = timedelta(seconds=60)
+
+# built once, hash is bound at execution (strict -> statement)
+# columns = INCLUDE list of uq_db_sessions_token_hash (index-only scan); strict -> others raise
+_BY_HASH = {
+    s: select(DBSession).options(
+        load_only(DBSession.id, DBSession.user_id, DBSession.csrf_token, DBSession.is_active,
+                  DBSession.last_seen, raiseload=s),
+        selectinload(DBSession.user),
+        *((raiseload("*"),) if s else ()),
+    ).where(DBSession.token_hash == bindparam("token_hash"))
+    for s in (True, False)
+}
+
+
 async def list_sessions(
     session: AsyncSession,
     *,
     user_id: Optional[int] = None,
-    offset: int = 0,
+    before: Optional[tuple[datetime, int]] = None,
     limit: int = 100
 ) -> List[DBSession]:
     """
-    Sessions list, pagination supported
+    Sessions list, newest first, keyset pagination: before = (created_at, id) of the last row
     """
-    q = select(DBSession)
+    q = select(DBSession).order_by(DBSession.created_at.desc(), DBSession.id.desc())
     if user_id is not None:
         q = q.where(DBSession.user_id == user_id)
-    q = q.offset(offset).limit(limit)
+    if before is not None:
+        q = q.where(tuple_(DBSession.created_at, DBSession.id) < tuple_(*before))
+    q = q.limit(limit)
     result = await session.execute(q)
-    return list(result.scalars().all())
+    return result.scalars().all()
 
 
 async def get_session_by_hash(
     session: AsyncSession,
     *,
-    token_hash: str
+    token_hash: bytes,
+    strict: bool = True
 ) -> Optional[DBSession]:
     """
     Get session by hash if present, else - None
+    Loads user & user.instance_ids (access checks, m2m ids only); strict -> anything else raises on access
     """
-    q = select(DBSession).options(selectinload(DBSession.user)).where(DBSession.token_hash == token_hash)
-    result = await session.execute(q)
-    return result.scalars().first()
+    result = await session.execute(_BY_HASH[strict], {"token_hash": token_hash})
+    sess = result.scalars().first()
+    if sess is not None and sess.user is not None:
+        sess.user.instance_ids = await get_instance_ids(session, user_id=sess.user_id)
+    return sess
 
 
 async def create_session(
     session: AsyncSession,
     *,
     user_id: int,
-    token_hash: str,
-    csrf_token: str,
+    token_hash: bytes,
+    csrf_token: bytes,
     ip: Optional[str] = None,
     user_agent: Optional[str] = None,
+    commit: bool = True,
 ) -> DBSession:
     """
     Create new session
@@ -58,44 +83,44 @@ async def create_session(
         user_agent=user_agent
     )
     session.add(dbs)
-    await session.commit()
-    await session.refresh(dbs)
+    if commit:
+        await session.commit()
+    else:
+        await session.flush()
     return dbs
 
 
 async def update_session(
     session: AsyncSession,
     dbs: DBSession,
+    *,
+    commit: bool = True,
     **fields: Any
 ) -> DBSession:
     """
-    Update session
+    Update session (single UPDATE ... RETURNING of changed columns)
     """
-    for field, value in fields.items():
-        if hasattr(dbs, field):
-            setattr(dbs, field, value)
-    session.add(dbs)
-    await session.commit()
-    await session.refresh(dbs)
+    await update_row(session, dbs, fields, commit=commit)
     return dbs
 
 
 async def delete_session(
     session: AsyncSession,
     *,
-    dbs: DBSession
+    dbs: DBSession,
+    commit: bool = True
 ) -> None:
     """
     Invalidate (delete) session
     """
-    await session.delete(dbs)
-    await session.commit()
+    await delete_row(session, dbs, commit=commit)
 
 
 async def delete_sessions_for_user(
     session: AsyncSession,
     *,
-    user_id: int
+    user_id: int,
+    commit: bool = True
 ) -> int:
     """
     Invalidate user sessions, deletes them all
@@ -103,15 +128,30 @@ async def delete_sessions_for_user(
     """
     q = delete(DBSession).where(DBSession.user_id == user_id).returning(DBSession.id)
     result = await session.execute(q)
-    await session.commit()
     deleted = result.all()
+    if commit:
+        await session.commit()
     return len(deleted)
 
 
 async def touch_session(session: AsyncSession, session_obj: DBSession) -> None:
     """
-    Updates last_seen -> session is valid for next 14 days
+    Updates last_seen -> session is valid for next 14 days.
+    At most once per _TOUCH_EVERY: last_seen is in the covering auth index, every UPDATE is a
+    non-HOT write of heap + index entries
     """
-    session_obj.last_seen = datetime.utcnow()
-    session.add(session_obj)
+    if session_obj.last_seen and datetime.utcnow() - session_obj.last_seen < _TOUCH_EVERY:
+        return
+    # DB clock (naive UTC like the column), new value comes back with RETURNING;
+    # the guard skips the write when a parallel request has just touched the session
+    now = func.timezone("utc", func.now(), type_=DateTime())
+    last_seen = await session.scalar(
+        update(DBSession)
+        .where(DBSession.id == session_obj.id, DBSession.last_seen < now - _TOUCH_EVERY)
+        .values(last_seen=now)
+        .returning(DBSession.last_seen)
+        .execution_options(synchronize_session=False)
+    )
+    if last_seen is not None:
+        set_committed_value(session_obj, "last_seen", last_seen)
     await session.commit()
@@ -1,21 +1,46 @@
 # shared/crud/user.py
 from __future__ import annotations
 
+import asyncio
 from typing import Optional, Sequence
 
-from sqlalchemy import select, update
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
-from shared.models import User, Instance
+from shared.crud._common import delete_row
+from shared.models import User, Instance, user_instance_access
 
 
-async def _uniq_username(session: AsyncSession, username: str, exclude_id: int | None = None) -> None:
-    q = select(User.id).where(User.username == username)
-    if exclude_id is not None:
-        q = q.where(User.id != exclude_id)
-    exists = await session.scalar(q)
-    if exists:
-        raise ValueError(f"Пользователь с таким именем уже существует")
+_BY_USERNAME = select(User).where(User.username == bindparam("username"))
+# m2m table only (PK (user_id, instance_id) -> index-only scan), instances aren't joined
+_INSTANCE_IDS = (select(user_instance_access.c.instance_id)
+                 .where(user_instance_access.c.user_id == bindparam("user_id")))
+
+
+async def _commit_user(session: AsyncSession, commit: bool = True) -> None:
+    """
+    commit (или flush, если транзакцией владеет вызывающий); уникальность username проверяет
+    сам индекс ix_users_username (без отдельного SELECT и без гонки между проверкой и вставкой)
+    """
+    try:
+        if commit:
+            await session.commit()
+        else:
+            await session.flush()
+    except IntegrityError as e:
+        await session.rollback()
+        if "ix_users_username" in str(e.orig):
+            raise ValueError("Пользователь с таким именем уже существует") from None
+        raise
+
+
+async def _get_instances(session: AsyncSession, instance_ids: Sequence[int]) -> list[Instance]:
+    """ один IN-запрос вместо session.get на каждый id; несуществующие id пропускаются """
+    rows = (await session.scalars(select(Instance).where(Instance.id.in_(set(instance_ids))))).all()
+    by_id = {i.id: i for i in rows}
+    return [by_id[iid] for iid in dict.fromkeys(instance_ids) if iid in by_id]
 
 
 async def list_users(session: AsyncSession, *, requested_by: User) -> list[User]:
@@ -24,17 +49,29 @@ async def list_users(session: AsyncSession, *, requested_by: User) -> list[User]
     • иначе — только самого запрашивающего
     """
     has_rights = bool(requested_by.is_owner or requested_by.can_manage_users)
-    q = select(User) if has_rights else select(User).where(User.id == requested_by.id)
-    return list((await session.execute(q)).scalars().all())
+    q = select(User).options(selectinload(User.instances))
+    if not has_rights:
+        q = q.where(User.id == requested_by.id)
+    return (await session.execute(q)).scalars().all()
 
 
 async def get_user_by_username(session: AsyncSession, *, username: str) -> Optional[User]:
-    return await session.scalar(select(User).where(User.username == username))
+    return await session.scalar(_BY_USERNAME, {"username": username})
+
+
+async def get_instance_ids(session: AsyncSession, *, user_id: int) -> frozenset[int]:
+    """ id инстансов, к которым у пользователя есть доступ (без full_access / is_owner) """
+    return frozenset((await session.scalars(_INSTANCE_IDS, {"user_id": user_id})).all())
+
+
+async def grant_instance_access(session: AsyncSession, *, user_id: int, instance_id: int) -> None:
+    """ добавляет доступ к инстансу в текущую транзакцию (без загрузки User.instances) """
+    await session.execute(insert(user_instance_access).values(user_id=user_id, instance_id=instance_id))
 
 
 async def get_users_by_tg_id(session: AsyncSession, *, telegram_id: int) -> list[User]:
     q = select(User).where(User.telegram_id == telegram_id)
-    return list((await session.execute(q)).scalars().all())
+    return (await session.execute(q)).scalars().all()
 
 
 async def create_user(
@@ -51,6 +88,7 @@ async def create_user(
     # instance access
     full_access: bool = False,
     instance_ids: Sequence[int] | None = None,
+    commit: bool = True,
 ) -> User:
     """
     Создаём пользователя и возвращаем его ORM-объект.
@@ -59,7 +97,6 @@ async def create_user(
     """
     if not username.strip():
         raise ValueError("Имя пользователя не может быть пустым")
-    await _uniq_username(session, username)
 
     user = User(
         username=username.strip(),
@@ -69,21 +106,18 @@ async def create_user(
         can_manage_users=can_manage_users,
         can_manage_instances=can_manage_instances,
         full_access=full_access,
+        instances=[],
+        sessions=[],
     )
-    user.password = password
+    # KDF off the event loop
+    user.hashed_password = await asyncio.to_thread(User.hash_password, password)
 
     if instance_ids:
-        valid = []
-        for iid in instance_ids:
-            inst = await session.get(Instance, iid)
-            if inst is None:
-                continue
-            valid.append(inst)
-        user.instances = valid
+        user.instances = await _get_instances(session, instance_ids)
 
     session.add(user)
-    await session.commit()
-    await session.refresh(user)
+    # id и дефолты приходят из INSERT ... RETURNING, отдельный refresh не нужен
+    await _commit_user(session, commit)
     return user
 
 
@@ -103,6 +137,7 @@ async def update_user(               # noqa: C901 — большая, но чи
     full_access: bool | None = None,
     # доступ к инстансам
     instance_ids: Sequence[int] | None = None,
+    commit: bool = True,
 ) -> User:
     """
     Обновляем поля пользователя; возвращаем актуальный объект.
@@ -114,7 +149,6 @@ async def update_user(               # noqa: C901 — большая, но чи
     if username is not None and username != user.username:
         if not username.strip():
             raise ValueError("Имя пользователя не может быть пустым")
-        await _uniq_username(session, username, exclude_id=user.id)
         user.username = username.strip()
 
     if telegram_id is not None:
@@ -124,7 +158,7 @@ async def update_user(               # noqa: C901 — большая, но чи
         user.is_active = is_active
 
     if new_password is not None:
-        user.password = new_password
+        user.hashed_password = await asyncio.to_thread(User.hash_password, new_password)
 
     if is_2fa_enabled is not None and not user.is_owner:   # владельцу нельзя отключить 2FA
         user.is_2fa_enabled = is_2fa_enabled
@@ -143,20 +177,13 @@ async def update_user(               # noqa: C901 — большая, но чи
             user.instances.clear()
 
     if instance_ids is not None:
-        valid = []
-        for iid in instance_ids:
-            inst = await session.get(Instance, iid)
-            if inst is None:
-                continue
-            valid.append(inst)
-        user.instances = valid
+        user.instances = await _get_instances(session, instance_ids)
 
     session.add(user)
-    await session.commit()
-    await session.refresh(user)
+    await _commit_user(session, commit)
     return user
 
 
-async def delete_user(session: AsyncSession, *, user: User) -> None:
-    await session.delete(user)
-    await session.commit()
+async def delete_user(session: AsyncSession, *, user: User, commit: bool = True) -> None:
+    # сессии и доступы к инстансам удаляет FK ON DELETE CASCADE
+    await delete_row(session, user, commit=commit)
@@ -6,7 +6,18 @@ def make_async_engine(url: str, echo: bool = False, **kwargs) \
         -> tuple[AsyncEngine, async_sessionmaker[AsyncSession]]:
     """
     Builds asyncpg engine and session maker
+    Pool defaults (caller's kwargs win): checked-out connections are pinged, recycled every 30 min,
+    bigger asyncpg prepared statement caches
     """
+    if url.startswith("postgresql"):
+        kwargs.setdefault("pool_size", 20)
+        kwargs.setdefault("max_overflow", 30)
+        kwargs.setdefault("pool_timeout", 30)
+        kwargs.setdefault("pool_pre_ping", True)
+        kwargs.setdefault("pool_recycle", 1800)
+        connect_args = kwargs.setdefault("connect_args", {})
+        connect_args.setdefault("prepared_statement_cache_size", 512)   # SQLAlchemy's per-connection cache
+        connect_args.setdefault("statement_cache_size", 1024)           # asyncpg's own (raw connection use)
     engine = create_async_engine(url, echo=echo, **kwargs)
     session_maker = async_sessionmaker(engine, expire_on_commit=False)
     return engine, session_maker
@@ -30,6 +30,7 @@ NEW_MESSAGE = ("*От:* {name}\n"
 NEW_CALL = ("📞 *Входящий звонок*\n"
             "*От:* {name}\n"
             "*Номер:* `{phone}`")
+NEW_FILES = "📎 Вложений: {count}"
 
 # unused
 ON_INSTANCE_ADDED = ("Инстанс {instance} привязан к этому каналу.\n\n"
@@ -1,13 +1,27 @@
+import atexit
 import logging
 import logging.handlers as lh
-import os, sys
+import os, queue, sys
 from pathlib import Path
 from typing import Union
 
 _format = "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s"
 _datetime = "%d-%m %H:%M:%S"
 
-formatter = logging.Formatter(_format, _datetime)
+
+class _SecondCachedFormatter(logging.Formatter):
+    """ _datetime has 1 s resolution: localtime + strftime once per second, not once per record """
+
+    _cached: tuple[int, str] = (-1, "")
+
+    def formatTime(self, record: logging.LogRecord, datefmt: Union[str, None] = None) -> str:
+        sec = int(record.created)
+        if sec != self._cached[0]:
+            self._cached = (sec, super().formatTime(record, datefmt))
+        return self._cached[1]
+
+
+formatter = _SecondCachedFormatter(_format, _datetime)
 
 stdout_handler = logging.StreamHandler(sys.stdout)
 stdout_handler.setFormatter(formatter)
@@ -15,20 +29,26 @@ stdout_handler.setLevel(logging.INFO)
 
 LOG_DIR = Path(os.getenv("LOG_DIR", "/app/logs"))
 LOG_DIR.mkdir(parents=True, exist_ok=True)
-# 1mb, 10 files rotating handler
+# 10mb, 10 files rotating handler
 file_handler = lh.RotatingFileHandler(
     LOG_DIR / "app.log",
-    maxBytes=1_000_000,
+    maxBytes=10_000_000,
     backupCount=10,
     encoding="utf-8",
 )
 file_handler.setFormatter(formatter)
 file_handler.setLevel(logging.INFO)
 
+# callers (event loop) only put records into a queue; formatting, writes and rotation
+# happen in the listener thread
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_listener = lh.QueueListener(_log_queue, stdout_handler, file_handler, respect_handler_level=True)
+_listener.start()
+atexit.register(_listener.stop)     # flushes what's left in the queue
+
 root = logging.getLogger()
 root.setLevel(logging.INFO)
-root.addHandler(stdout_handler)
-root.addHandler(file_handler)
+root.addHandler(lh.QueueHandler(_log_queue))
 root.propagate = False
 
 # shutup, libraries! (clears up logs a little)
@@ -1,21 +1,27 @@
 from enum import unique
 
 from sqlalchemy import String, Integer, ForeignKey, Boolean, DateTime, Float, Text, Enum, BigInteger, UniqueConstraint, \
-    Index, Table, Column, Computed
-from sqlalchemy.dialects.postgresql import TSVECTOR
+    Index, Table, Column, LargeBinary, text, func, literal_column
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, mapped_column, relationship, column_property
 from datetime import datetime, timedelta
 import enum
 from typing import Optional, List
-from passlib.hash import bcrypt
+import bcrypt
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 
 from shared.database import Base
 
+_PASSWORD_HASHER = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)  # argon2id by default
+
 
 # ========
 # Enums
 # ========
+# columns are native PG enums (instancestate, messagestatus, ...) whose labels are the member NAMES,
+# not the values: raw SQL passes e.g. MessageStatus.error_api.name ('error_api'), not 'api_error'.
+# SQLAlchemy's Enum decodes a label with a single dict lookup, don't add asyncpg codecs on top
 class InstanceState(enum.Enum):
     unknown = "unknown"  # custom state (when couldn't get response from green api)
     authorized = "authorized"  #
@@ -68,6 +74,8 @@ class FileType(enum.Enum):
 # ========
 # Models
 # ========
+# collections are lazy="raise_on_sql": nothing is fanned out implicitly, every query opts in
+# to what it needs (selectinload / joinedload), an unplanned lazy load raises
 class TelegramChannel(Base):
     __tablename__ = "tg_channels"
 
@@ -83,6 +91,7 @@ class TelegramChannel(Base):
         "Instance",
         back_populates="telegram_channel",
         cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
 
@@ -127,36 +136,50 @@ class Instance(Base):
         "Message",
         back_populates="instance",
         cascade="all, delete-orphan",
-        lazy="selectin",
+        passive_deletes=True,
+        lazy="raise_on_sql",
     )
     conversations: Mapped[list["Conversation"]] = relationship(
         "Conversation",
         back_populates="instance",
         cascade="all, delete-orphan",
-        lazy="selectin",
+        passive_deletes=True,
+        lazy="raise_on_sql",
     )
     users: Mapped[List["User"]] = relationship(
         "User",
         secondary=user_instance_access,
         back_populates="instances",
-        lazy="selectin",
+        lazy="raise_on_sql",
     )
 
 
 class Message(Base):
     __tablename__ = "messages"
+    # fillfactor=85, CLUSTER ON ix_msg_chat_created (migration f6b3d9a27c14)
     __table_args__ = (
         UniqueConstraint("instance_id", "wa_message_id", name="uq_msg_wa"),
         Index(
-            "ix_msg_conv",
+            "ix_msg_chat_created",
+            "instance_id", "chat_id", "created_at", "id",
+            postgresql_using="btree",
+            postgresql_ops={"created_at": "DESC", "id": "DESC"},
+        ),
+        # expression index, must stay identical to Message.text_search for the planner to use it;
+        # instance_id (btree_gin) narrows postings to the tenant inside the same index scan
+        Index("ix_msg_text_search", "instance_id", text("to_tsvector('russian'::regconfig, coalesce(text, ''))"),
+              postgresql_using="gin"),
+        # partial: only unread inbound rows (a tiny fraction) are indexed; the predicate must match
+        # the mark-seen UPDATEs in shared/crud/conversations.py
+        Index("ix_msg_unseen_inc", "conversation_id",
+              postgresql_where=text("is_seen IS FALSE AND direction = 'inc'")),
+        Index(
+            "ix_msg_auto_recent",
             "instance_id", "chat_id", "created_at",
             postgresql_using="btree",
             postgresql_ops={"created_at": "DESC"},
+            postgresql_where=text("is_auto"),
         ),
-        Index("ix_msg_conv_created_desc", "conversation_id", "created_at",
-              postgresql_using="btree", postgresql_ops={"created_at": "DESC"}),
-        Index("ix_msg_text_search", "text_search", postgresql_using="gin"),
-        Index("ix_msg_inc_unseen", "conversation_id", "is_seen", "direction"),
     )
 
     # auto
@@ -196,12 +219,14 @@ class Message(Base):
         "MessageFile",
         back_populates="message",
         cascade="all, delete-orphan",
-        lazy="selectin",
+        passive_deletes=True,
+        lazy="raise_on_sql",
     )
-    # search
-    text_search = mapped_column(
-        TSVECTOR,
-        Computed("to_tsvector('russian', coalesce(text, ''))", persisted=True)
+    # search: SQL expression only (matched by ix_msg_text_search), never stored nor selected
+    text_search = column_property(
+        func.to_tsvector(literal_column("'russian'::regconfig"), func.coalesce(text, literal_column("''"))),
+        deferred=True,
+        raiseload=True,
     )
 
     @property
@@ -234,9 +259,14 @@ class MessageFile(Base):
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    # every incoming message rewrites the row (trigger counters), autovacuum runs at 2% dead tuples
+    # instead of 20% (ALTER TABLE ... SET in migration e1a5c8f30d46)
     __table_args__ = (
         UniqueConstraint("instance_id", "chat_id", name="uq_conv_instance_chat"),
-        Index("ix_conv_instance_arch_updated", "instance_id", "is_archived", "updated_at"),
+        Index("ix_conv_active", "instance_id", "updated_at", postgresql_where=text("is_archived IS FALSE")),
+        Index("ix_conv_instance_pinned_last", "instance_id", "pinned", "last_message_at",
+              postgresql_using="btree",
+              postgresql_ops={"pinned": "DESC", "last_message_at": "DESC NULLS LAST"}),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
@@ -254,6 +284,10 @@ class Conversation(Base):
     pinned: Mapped[bool] = mapped_column(Boolean, default=False)
 
     unread_inc_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # last message, maintained by DB trigger (app/utils/triggers.py)
+    last_message_text: Mapped[str | None] = mapped_column(Text)     # first 512 chars
+    last_message_at: Mapped[datetime | None] = mapped_column(DateTime)
+    last_message_direction: Mapped[MessageDirection | None] = mapped_column(Enum(MessageDirection))
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -262,14 +296,15 @@ class Conversation(Base):
         "Message",
         back_populates="conversation",
         cascade="all, delete-orphan",
-        lazy="selectin",
+        passive_deletes=True,
+        lazy="raise_on_sql",
     )
 
     tags: Mapped[list["ChatTag"]] = relationship(
         "ChatTag",
         secondary="conversation_tags",
         back_populates="conversations",
-        lazy="selectin",
+        lazy="raise_on_sql",
     )
 
 
@@ -297,11 +332,15 @@ class User(Base):
     instances: Mapped[list["Instance"]] = relationship(
         "Instance",
         secondary=user_instance_access,
-        lazy="selectin",
+        lazy="raise_on_sql",
     )
     # relations
     sessions: Mapped[list["DBSession"]] = relationship("DBSession",
-                                                       cascade="all, delete-orphan", lazy="selectin")
+                                                       cascade="all, delete-orphan", passive_deletes=True,
+                                                       lazy="raise_on_sql")
+    # not mapped: ids from user_instance_access, filled by get_session_by_hash for the
+    # authenticated user (frozenset, access checks are set lookups); None -> not loaded
+    instance_ids = None
 
     @property
     def password(self):
@@ -309,10 +348,38 @@ class User(Base):
 
     @password.setter
     def password(self, pwd):
-        self.hashed_password = bcrypt.hash(pwd)
+        self.hashed_password = self.hash_password(pwd)
+
+    @staticmethod
+    def hash_password(pwd: str) -> str:
+        """
+        Argon2id (OWASP minimum: m=19 MiB, t=2, p=1), ~20-40 ms of CPU;
+        async code calls it via asyncio.to_thread (argon2-cffi releases the GIL)
+        """
+        return _PASSWORD_HASHER.hash(pwd)
 
     def verify_password(self, pwd):
-        return bcrypt.verify(pwd, self.hashed_password)
+        if not self.hashed_password:
+            return False
+        if self.hashed_password.startswith("$2"):
+            # legacy bcrypt hash ($2b$, 12 rounds), replaced on the next successful login
+            # bcrypt uses only 72 bytes (passlib truncated silently, bcrypt>=5 raises)
+            return bcrypt.checkpw(pwd.encode()[:72], self.hashed_password.encode())
+        try:
+            return _PASSWORD_HASHER.verify(self.hashed_password, pwd)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    def password_needs_rehash(self) -> bool:
+        """ True for legacy bcrypt hashes and Argon2 hashes made with other parameters """
+        if not self.hashed_password:
+            return False
+        if self.hashed_password.startswith("$2"):
+            return True
+        try:
+            return _PASSWORD_HASHER.check_needs_rehash(self.hashed_password)
+        except InvalidHashError:
+            return False
 
 
 conversation_tags = Table(
@@ -337,7 +404,7 @@ class ChatTag(Base):
         "Conversation",
         secondary=conversation_tags,
         back_populates="tags",
-        lazy="selectin",
+        lazy="raise_on_sql",
     )
 
 
@@ -350,17 +417,20 @@ class DBSession(Base):
     __tablename__ = "db_sessions"
     __table_args__ = (
         Index("ix_db_sessions_user_created", "user_id", "created_at"),
+        # auth lookup by hash reads only these columns -> index-only scan
+        Index("uq_db_sessions_token_hash", "token_hash", unique=True,
+              postgresql_include=["id", "user_id", "csrf_token", "is_active", "last_seen"]),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     user: Mapped["User"] = relationship(back_populates="sessions")
-    token_hash: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
-    csrf_token: Mapped[str] = mapped_column(String(32), nullable=False)
+    token_hash: Mapped[bytes] = mapped_column(LargeBinary(32), nullable=False)
+    csrf_token: Mapped[bytes] = mapped_column(LargeBinary(16), nullable=False)
     ip: Mapped[str | None] = mapped_column(String(45))
     user_agent: Mapped[str] = mapped_column(String(256))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
-    last_seen: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    last_seen: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)  # touch_session only
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
 
     @hybrid_property